@@ -1,3 +1,5 @@
+import functools
+import heapq
 from collections import defaultdict
 
 def get_registers(instr):
@@ -10,6 +12,16 @@ def get_registers(instr):
     srcs = [r for r in (src1, src2) if r is not None]
     return dest, srcs
 
+# Base latency (in cycles) of each operation, before the data-size cost is added.
+BASE_LATENCIES = {
+    "ADD": 1,
+    "SUB": 1,
+    "MUL": 2,
+    "MOVE": 3,
+    "LOAD": 3,
+    "STORE": 3,
+}
+
 def compute_latency(instr):
     """
     Returns a simple latency value based on the operation and data size.
@@ -17,100 +29,291 @@ def compute_latency(instr):
     add extra cost depending on the size of the data.
     """
     op, dest, src1, src2, size = instr
-    base_latencies = {
-        "ADD": 1,
-        "SUB": 1,
-        "MUL": 2,
-        "MOVE": 3,
-        "LOAD": 3,
-        "STORE": 3,
-    }
-    base = base_latencies.get(op, 1)
+    base = BASE_LATENCIES.get(op, 1)
     # For simplicity, add 1 extra cycle per 10 data units.
     extra = size // 10
     return base + extra
 
 
-def schedule_instructions(instructions, bundle_size=2):
+# The op-code of an operation is its index in this tuple.
+OPCODES = ("ADD", "SUB", "MUL", "MOVE", "LOAD", "STORE")
+
+# Functional unit each operation issues on. schedule_instructions(..., slots=...) caps
+# how many instructions of each unit a bundle may hold.
+UNITS = {
+    "ADD": "alu",
+    "SUB": "alu",
+    "MUL": "mul",
+    "MOVE": "alu",
+    "LOAD": "mem",
+    "STORE": "mem",
+}
+
+def compile_program(instructions):
     """
-    A VLIW scheduler that groups instructions into bundles.
-      - It reorders the instructions (when possible) so that any instruction whose operands
-        are ready and that does not conflict with others in the same bundle is scheduled now.
-      - Intra–bundle conflicts are prevented (e.g. an instruction may not read a register
-        that is produced by another instruction in the same bundle).
-      - Dependencies are checked using a reg_avail table.
-    
-    Dependency tracking is fixed: registers that are not “externally provided” are not
-    assumed to be available until they are produced in an earlier bundle. (For our DAG,
-    external registers are those that appear as LOAD keys, e.g. "input0", "input1", etc.)
-    
-    Returns a list of bundles, where each bundle is a tuple: (start_cycle, list_of_instructions).
+    Lower the instruction tuples into parallel columns (a structure of arrays) so the
+    scheduler indexes small integers instead of re-unpacking tuples on every check.
+
+    Register names are interned to ids 0..n_regs-1 in order of first appearance;
+    a missing register is encoded as -1. The columns follow get_registers.
+
+    Returns (ops, dest_id, src1_id, src2_id, latency, n_regs).
     """
-    # === Pre‐process registers: mark which names are “externally” available.
-    # For instructions other than STORE the first operand is the destination.
-    produced = set()
-    for instr in instructions:
-        op, dest, src1, src2, size = instr
-        if op != "STORE":
-            produced.add(dest)
-    # A register appearing in a source that is not produced by any instruction is external.
-    external = set()
+    reg_id = {}
+
+    def intern(reg):
+        if reg is None:
+            return -1
+        return reg_id.setdefault(reg, len(reg_id))
+
+    ops, dest_id, src1_id, src2_id, latency = [], [], [], [], []
     for instr in instructions:
-        _, srcs = get_registers(instr)
-        for r in srcs:
-            if r not in produced:
-                external.add(r)
-    # For external registers, they are available at cycle 0.
-    # For any other register (i.e. one that will be computed), we assume it’s not available until scheduled.
-    reg_avail = {r: 0 for r in external}
+        if instr[0] not in OPCODES:
+            raise ValueError(f"Unknown operation: {instr[0]}")
+        dest, srcs = get_registers(instr)
+        src1, src2 = (srcs + [None, None])[:2]
+        ops.append(OPCODES.index(instr[0]))
+        dest_id.append(intern(dest))
+        src1_id.append(intern(src1))
+        src2_id.append(intern(src2))
+        latency.append(compute_latency(instr))
+    return ops, dest_id, src1_id, src2_id, latency, len(reg_id)
+
+def _dependency_graph(dest_id, src1_id, src2_id, n_regs):
+    """
+    Builds the dependency graph that schedule_instructions schedules by, from the
+    register columns of compile_program.
+
+    Returns (producer, consumers, successors, pred_count, order): producer[r] is the
+    instruction that writes register r (-1 if none), consumers[r] lists the
+    instructions that read it, successors[idx] are the instructions that read the
+    register idx produces, pred_count[idx] counts their producers and order is a
+    topological order. Raises ValueError if the registers form a dependency cycle, e.g.
+    an instruction that reads the register it writes.
+    """
+    n = len(dest_id)
+    producer = [-1] * n_regs
+    consumers = [[] for _ in range(n_regs)]
+    for idx in range(n):
+        d, s1, s2 = dest_id[idx], src1_id[idx], src2_id[idx]
+        if d >= 0 and producer[d] < 0:
+            producer[d] = idx
+        if s1 >= 0:
+            consumers[s1].append(idx)
+        if s2 >= 0 and s2 != s1:
+            consumers[s2].append(idx)
+    successors = [
+        consumers[d] if d >= 0 and producer[d] == idx else []
+        for idx, d in enumerate(dest_id)
+    ]
+    # A register that is not produced by any instruction is external and available at
+    # cycle 0, so only internally produced sources count as predecessors.
+    pred_count = [0] * n
+    for idx in range(n):
+        for succ in successors[idx]:
+            pred_count[succ] += 1
+
+    # Visit the DAG in topological order (the list grows while it is walked); anything
+    # left unvisited waits on itself through a cycle.
+    order = [idx for idx in range(n) if pred_count[idx] == 0]
+    waiting = pred_count[:]
+    for idx in order:
+        for succ in successors[idx]:
+            waiting[succ] -= 1
+            if waiting[succ] == 0:
+                order.append(succ)
+    if len(order) < n:
+        raise ValueError("Cannot schedule instructions: dependency cycle between registers")
+    return producer, consumers, successors, pred_count, order
+
+@functools.lru_cache(maxsize=64)
+def _schedule_cached(instructions, bundle_size, min_pressure, slots):
+    """
+    Memoized body of schedule_instructions. instructions must be a tuple and slots a
+    tuple of (unit, cap) pairs so the call can be cached; returns (bundles,
+    peak_pressure) with every bundle frozen to a tuple, since the result is shared
+    between calls.
+    """
+    ops, dest_id, src1_id, src2_id, latency, n_regs = compile_program(instructions)
+    n = len(instructions)
+
+    producer, consumers, successors, pred_count, order = _dependency_graph(
+        dest_id, src1_id, src2_id, n_regs
+    )
+
+    # === Critical-path heights
+    # Accumulate height[idx] = latency[idx] + max(height of its successors) backwards
+    # along the topological order.
+    height = latency[:]
+    for idx in reversed(order):
+        if successors[idx]:
+            height[idx] += max(height[succ] for succ in successors[idx])
 
     # === Main scheduling loop
-    unscheduled = instructions[:]  # copy the list of instructions
+    # pending holds (ready_cycle, idx) for instructions whose producers have all been
+    # scheduled. Once current_cycle reaches its ready_cycle an instruction moves to
+    # ready, a heap of (-height, idx): whatever can issue now goes tallest first, and
+    # ties are broken by program order.
+    ready_cycle = [0] * n
+    # Per-register bundle stamps: written[r] / read[r] hold the index of the last bundle
+    # that wrote / read register r, so membership in the current bundle is a single
+    # comparison and nothing has to be cleared between bundles. The spare slot at the
+    # end absorbs the -1 of a missing source operand.
+    written = [-1] * (n_regs + 1)
+    read = [-1] * (n_regs + 1)
+    # Issue slots: unit_of[idx] indexes caps if the functional unit of idx is capped,
+    # and is -1 otherwise; used counts the slots the current bundle has taken.
+    unit_index = {unit: k for k, (unit, _) in enumerate(slots)}
+    caps = [cap for _, cap in slots]
+    unit_of = [unit_index.get(UNITS[OPCODES[op]], -1) for op in ops]
+    pending = [(0, idx) for idx in range(n) if pred_count[idx] == 0]
+    ready = []
+    # === Register pressure
+    # uses_left[r] counts the readers of register r that have not issued yet; live is
+    # the number of produced registers that still have readers to come (or none at
+    # all, i.e. results).
+    uses_left = [len(readers) for readers in consumers]
+    live = peak = 0
+
+    def pressure_delta(idx):
+        # Change in live registers if idx issued now: its result becomes live, and any
+        # source it is the last reader of dies.
+        d, s1, s2 = dest_id[idx], src1_id[idx], src2_id[idx]
+        delta = 1 if d >= 0 and producer[d] == idx else 0
+        for s in (s1,) if s2 == s1 else (s1, s2):
+            if s >= 0 and producer[s] >= 0 and uses_left[s] == 1:
+                delta -= 1
+        return delta
+
+    def pressure_key(entry):
+        # (delta, -height, ready_cycle, idx): smallest growth first, then the tallest.
+        neg_height, idx = entry
+        return pressure_delta(idx), neg_height, ready_cycle[idx], idx
+
     bundles = []
     current_cycle = 0
 
-    while unscheduled:
+    while pending or ready:
+        # If no instruction can issue yet, wait until the earliest one can.
+        if not ready:
+            current_cycle = max(current_cycle, pending[0][0])
+        while pending and pending[0][0] <= current_cycle:
+            idx = heapq.heappop(pending)[1]
+            heapq.heappush(ready, (-height[idx], idx))
         current_bundle = []
-        # Try to add as many ready instructions as possible (up to bundle_size).
-        for instr in unscheduled[:]:
-            if len(current_bundle) >= bundle_size:
-                break
-            dest, srcs = get_registers(instr)
-            # Check that all source registers are available:
-            if any(reg_avail.get(r, float('inf')) > current_cycle for r in srcs):
-                continue
-            # Check intra–bundle conflicts: an instruction is disallowed if:
-            #   - its destination (if any) appears as a source of an instruction already in the bundle,
-            #   - an instruction already in the bundle writes to the same register,
-            #   - or its destination appears as a source in an already–scheduled instruction.
-            conflict = False
-            for b in current_bundle:
-                b_dest, b_srcs = get_registers(b)
-                if (b_dest is not None and b_dest in srcs) or \
-                   (dest is not None and dest == b_dest) or \
-                   (dest is not None and dest in b_srcs):
-                    conflict = True
+        deferred = []
+        candidates = []
+        stamp = len(bundles)
+        used = [0] * len(caps)
+        if min_pressure:
+            # The pressure of an instruction changes as others issue, so weigh every
+            # instruction that can issue now instead of trusting the heap order.
+            candidates, ready = ready, []
+        # Pop ready instructions until the bundle is full.
+        while len(current_bundle) < bundle_size:
+            if min_pressure:
+                if not candidates:
                     break
-            if conflict:
+                best = min(range(len(candidates)), key=lambda c: pressure_key(candidates[c]))
+                # Pop by position: list.remove would rescan and compare the tuples.
+                entry = candidates.pop(best)
+            elif ready:
+                entry = heapq.heappop(ready)
+            else:
+                break
+            idx = entry[1]
+            d, s1, s2, u = dest_id[idx], src1_id[idx], src2_id[idx], unit_of[idx]
+            # Check intra–bundle conflicts: an instruction is disallowed if it writes a
+            # register the bundle already reads or writes, or reads a register the
+            # bundle writes, or if every slot of its functional unit is taken.
+            if (d >= 0 and (written[d] == stamp or read[d] == stamp)) or \
+               written[s1] == stamp or written[s2] == stamp or \
+               (u >= 0 and used[u] == caps[u]):
+                # Retry it in the next bundle.
+                deferred.append(entry)
                 continue
-            # If we get here, this instruction is ready and doesn’t conflict.
-            current_bundle.append(instr)
-            unscheduled.remove(instr)
-        if current_bundle:
-            # Update register availability: each instruction that produces a register
-            # makes that register available only after its own latency.
-            bundle_latency = max(compute_latency(instr) for instr in current_bundle)
-            for instr in current_bundle:
-                dest, _ = get_registers(instr)
-                if dest is not None:
-                    reg_avail[dest] = current_cycle + compute_latency(instr)
-            bundles.append((current_cycle, current_bundle))
-            current_cycle += bundle_latency
-        else:
-            # If no instruction could be scheduled, wait one cycle.
-            current_cycle += 1
-
-    return bundles
+            if d >= 0:
+                written[d] = stamp
+            read[s1] = read[s2] = stamp
+            if u >= 0:
+                used[u] += 1
+            if d >= 0 and producer[d] == idx:
+                live += 1
+            for s in (s1,) if s2 == s1 else (s1, s2):
+                if s >= 0 and producer[s] >= 0:
+                    uses_left[s] -= 1
+                    if uses_left[s] == 0:
+                        live -= 1
+            current_bundle.append(idx)
+        peak = max(peak, live)
+        for entry in deferred + candidates:
+            heapq.heappush(ready, entry)
+
+        # Retire the bundle: a successor becomes ready once all of its producers have
+        # been scheduled, at the cycle the slowest of them finishes.
+        bundle_latency = max(latency[idx] for idx in current_bundle)
+        for idx in current_bundle:
+            done = current_cycle + latency[idx]
+            for succ in successors[idx]:
+                ready_cycle[succ] = max(ready_cycle[succ], done)
+                pred_count[succ] -= 1
+                if pred_count[succ] == 0:
+                    heapq.heappush(pending, (ready_cycle[succ], succ))
+        current_bundle.sort()
+        bundles.append((current_cycle, tuple(instructions[idx] for idx in current_bundle)))
+        current_cycle += bundle_latency
+
+    return tuple(bundles), peak
+
+def schedule_instructions(
+    instructions, bundle_size=2, min_pressure=False, stats=None, slots=None
+):
+    """
+    A VLIW list scheduler that groups instructions into bundles.
+      - Every instruction keeps a count of the producers it is still waiting on
+        (pred_count). Once that count reaches 0 it is pushed onto a pending heap keyed
+        by the earliest cycle it may issue, and from there onto a ready heap keyed by
+        height once that cycle comes, so filling a bundle is a few heap pops instead
+        of a rescan of every unscheduled instruction.
+      - Of all the instructions that can issue in the current cycle, the tallest go
+        first: height is the longest chain of latencies from an instruction to the end
+        of the DAG, so the critical path is issued before work that can wait, however
+        long that work has been ready.
+      - With min_pressure=True, the instruction that grows the set of live registers the
+        least goes first instead (a register is live from the instruction that produces
+        it until its last reader issues), trading a few cycles for fewer registers held
+        at once.
+      - Intra–bundle conflicts are prevented (e.g. an instruction may not write a register
+        that is read or written by another instruction in the same bundle).
+      - slots, e.g. {"mem": 1, "alu": 2, "mul": 1}, models the functional units of the
+        machine: a bundle holds at most slots[unit] instructions of each unit (see
+        UNITS) on top of the bundle_size cap. Units missing from slots are unlimited.
+      - Schedules are memoized on (instructions, bundle_size, min_pressure, slots) in an
+        LRU cache of 64 entries, so scheduling the same DAG again only copies the
+        bundles. Instructions may also be lists; the bundles hold them as tuples.
+
+    Dependency tracking is fixed: registers that are not “externally provided” are not
+    assumed to be available until they are produced in an earlier bundle. (For our DAG,
+    external registers are those that appear as LOAD keys, e.g. "input0", "input1", etc.)
+
+    Returns a list of bundles, where each bundle is a tuple: (start_cycle, list_of_instructions).
+    If a stats dict is passed, the peak number of live registers is stored in it under
+    "peak_pressure".
+    """
+    if bundle_size < 1:
+        raise ValueError("bundle_size must be >= 1")
+    # The cache key must be hashable, so instructions given as lists become tuples.
+    instructions = tuple(map(tuple, instructions))
+    slots = tuple(sorted((slots or {}).items()))
+    for unit, cap in slots:
+        if unit not in UNITS.values():
+            raise ValueError(f"Unknown functional unit: {unit}")
+        if cap < 1:
+            raise ValueError(f"Functional unit {unit} needs at least one slot, got {cap}")
+    bundles, peak = _schedule_cached(instructions, bundle_size, min_pressure, slots)
+    if stats is not None:
+        stats["peak_pressure"] = peak
+    return [(cycle, list(bundle)) for cycle, bundle in bundles]
 
 # === Example Program ===
 # Each instruction is a tuple: (op, dest, src1, src2, size)
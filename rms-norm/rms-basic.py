@@ -1,52 +1,86 @@
-def sqrt_fixed(n):
+import math
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def rsqrt_fixed(n):
+    """
+    Compute 1/sqrt(n) without any division: seed with the Quake III magic-number
+    bit trick, then refine with five Newton steps y = y * (1.5 - 0.5 * n * y * y).
+    This is the same recipe the rms-vliw-quake-sqrt.py DAG unrolls.
+
+    The seed is a float32 trick, so n is first range-reduced to m * 2**e with m in
+    [0.5, 2) and e even: 1/sqrt(n) = 1/sqrt(m) * 2**(-e/2), which holds for any
+    positive float64. Zero gives inf; negative, infinite and NaN inputs take the
+    exact 1 / np.sqrt(n).
+    """
+    if n == 0.0:
+        return np.inf
+    if n < 0.0 or not np.isfinite(n):
+        return 1.0 / np.sqrt(n)
+    m, e = math.frexp(n)  # n = m * 2**e, m in [0.5, 1)
+    if e % 2:
+        m *= 2.0
+        e -= 1
+    word = np.empty(1, dtype=np.float32)
+    word[0] = m
+    bits = word.view(np.uint32)
+    bits[0] = 0x5F3759DF - (bits[0] >> 1)
+    y = np.float64(word[0])
+    # Unroll 5 Newton iterations (each one roughly doubles the correct digits)
+    half_m = 0.5 * m
+    y = y * (1.5 - half_m * y * y)
+    y = y * (1.5 - half_m * y * y)
+    y = y * (1.5 - half_m * y * y)
+    y = y * (1.5 - half_m * y * y)
+    y = y * (1.5 - half_m * y * y)
+    return math.ldexp(y, -e // 2)
+
+# fastmath without "nnan"/"ninf": rsqrt_fixed is compiled with the caller's flags, and
+# those two would let LLVM drop its checks for infinite and NaN inputs.
+@njit(fastmath={"reassoc", "contract", "nsz", "arcp", "afn"}, cache=True)
+def _rms_layer_norm_kernel(x, gamma, epsilon):
     """
-    Compute the square root of n using five fixed iterations of Newton's method.
-    This unrolled version avoids any loop constructs.
+    Fused RMS Layer Normalization: one pass accumulates the sum of squares and a
+    second pass writes the normalized output, without materializing x*x.
     """
-    if n < 0:
-        raise ValueError("Cannot compute square root of a negative number")
-    if n == 0:
-        return 0
-    # Initial guess:
-    x = n
-    # Unroll 5 iterations of Newton's method
-    x = 0.5 * (x + n / x)
-    x = 0.5 * (x + n / x)
-    x = 0.5 * (x + n / x)
-    x = 0.5 * (x + n / x)
-    x = 0.5 * (x + n / x)
-    return x
-
-def rms_layer_norm_3(x, gamma, epsilon=1e-8):
+    sum_sq = 0.0
+    for i in range(x.shape[0]):
+        sum_sq += x[i] * x[i]
+    inv_rms = rsqrt_fixed(sum_sq / x.shape[0] + epsilon)
+
+    out = np.empty_like(x)
+    for i in range(x.shape[0]):
+        out[i] = x[i] * inv_rms * gamma[i]
+    return out
+
+def rms_layer_norm(x, gamma, epsilon=1e-8):
     """
-    Applies RMS Layer Normalization to a fixed-size (3-element) input vector.
+    Applies RMS Layer Normalization to an input vector of any length.
     
     Parameters:
-      x       : A list of 3 numerical values.
-      gamma   : A list of 3 scaling factors.
+      x       : A sequence of N numerical values, N >= 1.
+      gamma   : A sequence of N scaling factors.
       epsilon : Small constant for numerical stability.
       
     Returns:
-      A list of 3 normalized and scaled values:
+      A NumPy array of N normalized and scaled values:
           output[i] = (x[i] / sqrt(mean(x^2) + epsilon)) * gamma[i]
     """
-    # Compute sum of squares (unrolled for three elements)
-    sum_sq = x[0]*x[0] + x[1]*x[1] + x[2]*x[2]
-    mean_sq = sum_sq / 3.0
-
-    # Compute RMS using the fixed-iteration sqrt function
-    rms = sqrt_fixed(mean_sq + epsilon)
-    
-    # Compute normalized outputs for each element (unrolled)
-    out0 = (x[0] / rms) * gamma[0]
-    out1 = (x[1] / rms) * gamma[1]
-    out2 = (x[2] / rms) * gamma[2]
-    
-    return [out0, out1, out2]
+    x = np.asarray(x, dtype=np.float64)
+    gamma = np.asarray(gamma, dtype=np.float64)
+    if x.ndim != 1 or x.shape[0] == 0:
+        raise ValueError(f"x must be a non-empty 1-D sequence, got shape {x.shape}")
+    if x.shape != gamma.shape:
+        raise ValueError("x and gamma must have the same shape")
+    return _rms_layer_norm_kernel(x, gamma, epsilon)
 
 
-x = [3.0, 4.0, 5.0]
-gamma = [0.1, 0.2, 0.3]
-normalized_x = rms_layer_norm_3(x, gamma)
-print(x)
-print(normalized_x)
+if __name__ == "__main__":
+    x = [3.0, 4.0, 5.0]
+    gamma = [0.1, 0.2, 0.3]
+    normalized_x = rms_layer_norm(x, gamma)
+    print(x)
+    print(normalized_x.tolist())
@@ -1,5 +1,11 @@
 #!/usr/bin/env python3
-import struct
+import ctypes
+import functools
+import heapq
+from collections import namedtuple
+
+import numpy as np
+from numba import get_num_threads, njit, prange
 
 # -----------------------------
 # PART 1. SCHEDULING (Compilation)
@@ -22,111 +28,508 @@ def get_registers(instr):
         return dest, srcs
 
 
+# Base latency (in cycles) of each operation, before the data-size cost is added.
+BASE_LATENCIES = {
+    "ADD": 1,
+    "SUB": 1,
+    "MUL": 2,
+    "DIV": 2,
+    "MOVE": 3,
+    "LOAD": 3,
+    "STORE": 3,
+    "FTOI": 3,
+    "ITOF": 3,
+    "SHR": 3,
+}
+
+
 def compute_latency(instr):
     """
     Compute a simple latency based on the operation and the data size.
     For example, a LOAD has a base latency of 3 cycles plus 1 extra cycle per 10 units.
     """
     op, dest, src1, src2, size = instr
-    base_latencies = {
-        "ADD": 1,
-        "SUB": 1,
-        "MUL": 2,
-        "DIV": 2,
-        "MOVE": 3,
-        "LOAD": 3,
-        "STORE": 3,
-        "FTOI": 3,
-        "ITOF": 3,
-        "SHR": 3,
-    }
-    base = base_latencies.get(op, 1)
+    base = BASE_LATENCIES.get(op, 1)
     extra = size // 10  # extra cycle per 10 units of data
     return base + extra
 
 
-def schedule_instructions(instructions, bundle_size=2):
+# The op-code of an operation is its index in this tuple.
+OPCODES = ("ADD", "SUB", "MUL", "DIV", "MOVE", "LOAD", "STORE", "FTOI", "ITOF", "SHR")
+
+
+# Functional unit each operation issues on. schedule_instructions(..., slots=...) caps
+# how many instructions of each unit a bundle may hold.
+UNITS = {
+    "ADD": "alu",
+    "SUB": "alu",
+    "MUL": "mul",
+    "DIV": "mul",
+    "MOVE": "alu",
+    "LOAD": "mem",
+    "STORE": "mem",
+    "FTOI": "alu",
+    "ITOF": "alu",
+    "SHR": "alu",
+}
+
+
+def compile_program(instructions):
     """
-    A VLIW scheduler that groups instructions into bundles.
-      - It reorders the instructions (when possible) so that any instruction whose operands
-        are ready and that does not conflict with others in the same bundle is scheduled now.
-      - Intra–bundle conflicts are prevented (e.g. an instruction may not read a register
-        that is produced by another instruction in the same bundle).
-      - Dependencies are checked using a reg_avail table.
+    Lower the instruction tuples into parallel columns (a structure of arrays) so the
+    scheduler indexes small integers instead of re-unpacking tuples on every check.
 
-    Dependency tracking is fixed: registers that are not "externally provided" are not
-    assumed to be available until they are produced in an earlier bundle. (For our DAG,
-    external registers are those that appear as LOAD keys, e.g. "input0", "input1", etc.)
+    Register names are interned to ids 0..n_regs-1 in order of first appearance;
+    a missing register is encoded as -1. The columns follow get_registers, so a
+    STORE has no destination and reads the register it stores.
 
-    Returns a list of bundles, where each bundle is a tuple: (start_cycle, list_of_instructions).
+    Returns (ops, dest_id, src1_id, src2_id, latency, n_regs), the first five as
+    NumPy arrays ready to be handed to _schedule_kernel.
     """
-    # === Pre‐process registers: mark which names are "externally" available.
-    # For instructions other than STORE the first operand is the destination.
-    produced = set()
-    for instr in instructions:
-        op, dest, src1, src2, size = instr
-        if op != "STORE":
-            produced.add(dest)
-    # A register appearing in a source that is not produced by any instruction is external.
-    external = set()
+    reg_id = {}
+
+    def intern(reg):
+        if reg is None:
+            return -1
+        return reg_id.setdefault(reg, len(reg_id))
+
+    ops, dest_id, src1_id, src2_id, latency = [], [], [], [], []
     for instr in instructions:
-        _, srcs = get_registers(instr)
-        for r in srcs:
-            if r not in produced:
-                external.add(r)
-    # For external registers, they are available at cycle 0.
-    # For any other register (i.e. one that will be computed), we assume it’s not available until scheduled.
-    reg_avail = {r: 0 for r in external}
+        if instr[0] not in OPCODES:
+            raise ValueError(f"Unknown operation: {instr[0]}")
+        dest, srcs = get_registers(instr)
+        src1, src2 = (srcs + [None, None])[:2]
+        ops.append(OPCODES.index(instr[0]))
+        dest_id.append(intern(dest))
+        src1_id.append(intern(src1))
+        src2_id.append(intern(src2))
+        latency.append(compute_latency(instr))
+    return (
+        np.array(ops, dtype=np.int8),
+        np.array(dest_id, dtype=np.int32),
+        np.array(src1_id, dtype=np.int32),
+        np.array(src2_id, dtype=np.int32),
+        np.array(latency, dtype=np.int32),
+        len(reg_id),
+    )
+
+
+@njit(cache=True)
+def _pressure_delta(idx, dest_id, src1_id, src2_id, producer, uses_left):
+    """
+    Change in live registers if instruction idx issued now: its result becomes live,
+    and any source it is the last reader of dies.
+    """
+    d, s1, s2 = dest_id[idx], src1_id[idx], src2_id[idx]
+    delta = 1 if d >= 0 and producer[d] == idx else 0
+    if s1 >= 0 and producer[s1] >= 0 and uses_left[s1] == 1:
+        delta -= 1
+    if s2 >= 0 and s2 != s1 and producer[s2] >= 0 and uses_left[s2] == 1:
+        delta -= 1
+    return delta
+
+
+@njit(cache=True)
+def _schedule_kernel(
+    dest_id,
+    src1_id,
+    src2_id,
+    latency,
+    unit_of,
+    caps,
+    n_regs,
+    bundle_size,
+    min_pressure,
+):
+    """
+    Compiled body of schedule_instructions, operating only on the integer columns
+    from compile_program. unit_of[idx] indexes caps if the functional unit of
+    instruction idx has a limited number of issue slots per bundle, and is -1 otherwise.
+
+    Returns (bundle_of, start_cycle, peak_pressure): the bundle index of every
+    instruction (-1 if it could not be scheduled), the start cycle of every bundle and
+    the peak number of live registers.
+    """
+    n = dest_id.shape[0]
+
+    # === Pre‐process: build the dependency graph.
+    # producer[r] is the instruction that writes register r (-1 if none). The readers
+    # of register r are cons_idx[cons_start[r]:cons_start[r + 1]].
+    producer = np.full(n_regs, -1, dtype=np.int32)
+    cons_start = np.zeros(n_regs + 1, dtype=np.int32)
+    for idx in range(n):
+        d, s1, s2 = dest_id[idx], src1_id[idx], src2_id[idx]
+        if d >= 0 and producer[d] < 0:
+            producer[d] = idx
+        if s1 >= 0:
+            cons_start[s1 + 1] += 1
+        if s2 >= 0 and s2 != s1:
+            cons_start[s2 + 1] += 1
+    for r in range(n_regs):
+        cons_start[r + 1] += cons_start[r]
+    cons_idx = np.empty(cons_start[n_regs], dtype=np.int32)
+    fill = cons_start[:n_regs].copy()
+    for idx in range(n):
+        s1, s2 = src1_id[idx], src2_id[idx]
+        if s1 >= 0:
+            cons_idx[fill[s1]] = idx
+            fill[s1] += 1
+        if s2 >= 0 and s2 != s1:
+            cons_idx[fill[s2]] = idx
+            fill[s2] += 1
+    # A register that is not produced by any instruction is external and available at
+    # cycle 0, so only internally produced sources count as predecessors.
+    pred_count = np.zeros(n, dtype=np.int32)
+    for r in range(n_regs):
+        if producer[r] >= 0:
+            for k in range(cons_start[r], cons_start[r + 1]):
+                pred_count[cons_idx[k]] += 1
+
+    # === Critical-path heights
+    # Visit the DAG in topological order (order grows while it is walked), then
+    # accumulate height[idx] = latency[idx] + max(height of its successors) backwards.
+    order = np.empty(n, dtype=np.int32)
+    n_order = 0
+    for idx in range(n):
+        if pred_count[idx] == 0:
+            order[n_order] = idx
+            n_order += 1
+    waiting = pred_count.copy()
+    k = 0
+    while k < n_order:
+        idx = order[k]
+        k += 1
+        d = dest_id[idx]
+        if d < 0 or producer[d] != idx:
+            continue
+        for j in range(cons_start[d], cons_start[d + 1]):
+            succ = cons_idx[j]
+            waiting[succ] -= 1
+            if waiting[succ] == 0:
+                order[n_order] = succ
+                n_order += 1
+    height = latency.astype(np.int64)
+    for k in range(n_order - 1, -1, -1):
+        idx = order[k]
+        d = dest_id[idx]
+        if d < 0 or producer[d] != idx:
+            continue
+        tallest = 0
+        for j in range(cons_start[d], cons_start[d + 1]):
+            tallest = max(tallest, height[cons_idx[j]])
+        height[idx] += tallest
 
     # === Main scheduling loop
-    unscheduled = instructions[:]  # copy the list of instructions
-    bundles = []
+    # pending holds (ready_cycle, idx) for instructions whose producers have all been
+    # scheduled. Once current_cycle reaches its ready_cycle an instruction moves to
+    # ready, a heap of (-height, idx): whatever can issue now goes tallest first, and
+    # ties are broken by program order.
+    ready_cycle = np.zeros(n, dtype=np.int64)
+    pending = [(np.int64(0), np.int64(idx)) for idx in range(n) if pred_count[idx] == 0]
+    ready = [pending[0] for _ in range(0)]
+    # === Register pressure
+    # uses_left[r] counts the readers of register r that have not issued yet; live is
+    # the number of produced registers that still have readers to come (or none at
+    # all, i.e. results).
+    uses_left = cons_start[1:] - cons_start[:n_regs]
+    live = 0
+    peak = 0
+    bundle_of = np.full(n, -1, dtype=np.int32)
+    start_cycle = np.empty(n, dtype=np.int64)
+    bundle_buf = np.empty(max(1, min(bundle_size, n)), dtype=np.int32)
+    # Per-register bundle stamps: written[r] / read[r] hold the index of the last bundle
+    # that wrote / read register r, so membership in the current bundle is a single
+    # comparison and nothing has to be cleared between bundles. The spare slot at the
+    # end absorbs the -1 of a missing source operand.
+    written = np.full(n_regs + 1, -1, dtype=np.int32)
+    read = np.full(n_regs + 1, -1, dtype=np.int32)
+    # Issue slots the current bundle has taken on each capped functional unit.
+    used = np.zeros(caps.shape[0], dtype=np.int32)
+    n_bundles = 0
     current_cycle = 0
 
-    while unscheduled:
-        current_bundle = []
-        # Try to add as many ready instructions as possible (up to bundle_size).
-        for instr in unscheduled[:]:
-            if len(current_bundle) >= bundle_size:
+    while len(pending) > 0 or len(ready) > 0:
+        # If no instruction can issue yet, wait until the earliest one can.
+        if len(ready) == 0:
+            current_cycle = max(current_cycle, pending[0][0])
+        while len(pending) > 0 and pending[0][0] <= current_cycle:
+            idx = heapq.heappop(pending)[1]
+            heapq.heappush(ready, (-height[idx], idx))
+        count = 0
+        used[:] = 0
+        deferred = [pending[0] for _ in range(0)]
+        candidates = [pending[0] for _ in range(0)]
+        if min_pressure:
+            # The pressure of an instruction changes as others issue, so weigh every
+            # instruction that can issue now instead of trusting the heap order.
+            while len(ready) > 0:
+                candidates.append(heapq.heappop(ready))
+        # Pop ready instructions until the bundle is full.
+        while count < bundle_size:
+            if min_pressure:
+                if len(candidates) == 0:
+                    break
+                best = 0
+                best_delta = 0
+                for c in range(len(candidates)):
+                    cand = candidates[c]
+                    delta = _pressure_delta(
+                        cand[1], dest_id, src1_id, src2_id, producer, uses_left
+                    )
+                    other = candidates[best]
+                    if c == 0 or (delta, cand[0], ready_cycle[cand[1]], cand[1]) < (
+                        best_delta,
+                        other[0],
+                        ready_cycle[other[1]],
+                        other[1],
+                    ):
+                        best = c
+                        best_delta = delta
+                entry = candidates.pop(best)
+            elif len(ready) > 0:
+                entry = heapq.heappop(ready)
+            else:
                 break
-            dest, srcs = get_registers(instr)
-            # Check that all source registers are available:
-            if any(reg_avail.get(r, float("inf")) > current_cycle for r in srcs):
+            idx = entry[1]
+            d, s1, s2, u = dest_id[idx], src1_id[idx], src2_id[idx], unit_of[idx]
+            # Check intra–bundle conflicts: an instruction is disallowed if it writes a
+            # register the bundle already reads or writes, or reads a register the
+            # bundle writes, or if every slot of its functional unit is taken.
+            if (
+                (d >= 0 and (written[d] == n_bundles or read[d] == n_bundles))
+                or written[s1] == n_bundles
+                or written[s2] == n_bundles
+                or (u >= 0 and used[u] == caps[u])
+            ):
+                # Retry it in the next bundle.
+                deferred.append(entry)
                 continue
-            # Check intra–bundle conflicts: an instruction is disallowed if:
-            #   - its destination (if any) appears as a source of an instruction already in the bundle,
-            #   - an instruction already in the bundle writes to the same register,
-            #   - or its destination appears as a source in an already–scheduled instruction.
-            conflict = False
-            for b in current_bundle:
-                b_dest, b_srcs = get_registers(b)
-                if (
-                    (b_dest is not None and b_dest in srcs)
-                    or (dest is not None and dest == b_dest)
-                    or (dest is not None and dest in b_srcs)
-                ):
-                    conflict = True
-                    break
-            if conflict:
+            if d >= 0:
+                written[d] = n_bundles
+            read[s1] = n_bundles
+            read[s2] = n_bundles
+            if u >= 0:
+                used[u] += 1
+            if d >= 0 and producer[d] == idx:
+                live += 1
+            if s1 >= 0 and producer[s1] >= 0:
+                uses_left[s1] -= 1
+                if uses_left[s1] == 0:
+                    live -= 1
+            if s2 >= 0 and s2 != s1 and producer[s2] >= 0:
+                uses_left[s2] -= 1
+                if uses_left[s2] == 0:
+                    live -= 1
+            bundle_buf[count] = idx
+            count += 1
+        peak = max(peak, live)
+        for entry in deferred:
+            heapq.heappush(ready, entry)
+        for entry in candidates:
+            heapq.heappush(ready, entry)
+
+        # Retire the bundle: a successor becomes ready once all of its producers have
+        # been scheduled, at the cycle the slowest of them finishes.
+        bundle_latency = 0
+        for k in range(count):
+            idx = bundle_buf[k]
+            bundle_of[idx] = n_bundles
+            bundle_latency = max(bundle_latency, latency[idx])
+            d = dest_id[idx]
+            if d < 0 or producer[d] != idx:
                 continue
-            # If we get here, this instruction is ready and doesn’t conflict.
-            current_bundle.append(instr)
-            unscheduled.remove(instr)
-        if current_bundle:
-            # Update register availability: each instruction that produces a register
-            # makes that register available only after its own latency.
-            bundle_latency = max(compute_latency(instr) for instr in current_bundle)
-            for instr in current_bundle:
-                dest, _ = get_registers(instr)
-                if dest is not None:
-                    reg_avail[dest] = current_cycle + compute_latency(instr)
-            bundles.append((current_cycle, current_bundle))
-            current_cycle += bundle_latency
-        else:
-            # If no instruction could be scheduled, wait one cycle.
-            current_cycle += 1
+            done = current_cycle + latency[idx]
+            for j in range(cons_start[d], cons_start[d + 1]):
+                succ = cons_idx[j]
+                ready_cycle[succ] = max(ready_cycle[succ], done)
+                pred_count[succ] -= 1
+                if pred_count[succ] == 0:
+                    heapq.heappush(pending, (ready_cycle[succ], np.int64(succ)))
+        start_cycle[n_bundles] = current_cycle
+        n_bundles += 1
+        current_cycle += bundle_latency
+
+    return bundle_of, start_cycle[:n_bundles], peak
+
+
+@functools.lru_cache(maxsize=64)
+def _schedule_cached(instructions, bundle_size, min_pressure, slots):
+    """
+    Memoized body of schedule_instructions. instructions must be a tuple and slots a
+    tuple of (unit, cap) pairs so the call can be cached; returns (bundles,
+    peak_pressure) with every bundle frozen to a tuple, since the result is shared
+    between calls.
+    """
+    ops, dest_id, src1_id, src2_id, latency, n_regs = compile_program(instructions)
+    unit_index = {unit: k for k, (unit, _) in enumerate(slots)}
+    unit_of = np.array(
+        [unit_index.get(UNITS[OPCODES[op]], -1) for op in ops], dtype=np.int32
+    )
+    caps = np.array([cap for _, cap in slots], dtype=np.int32)
+    bundle_of, start_cycle, peak = _schedule_kernel(
+        dest_id,
+        src1_id,
+        src2_id,
+        latency,
+        unit_of,
+        caps,
+        n_regs,
+        bundle_size,
+        min_pressure,
+    )
+    if (bundle_of < 0).any():
+        raise ValueError(
+            "Cannot schedule instructions: dependency cycle between registers"
+        )
+
+    bundles = [(int(cycle), []) for cycle in start_cycle]
+    for instr, b in zip(instructions, bundle_of):
+        bundles[b][1].append(instr)
+    return tuple((cycle, tuple(bundle)) for cycle, bundle in bundles), int(peak)
+
+
+def schedule_instructions(
+    instructions, bundle_size=2, min_pressure=False, stats=None, slots=None
+):
+    """
+    A VLIW list scheduler that groups instructions into bundles.
+      - Every instruction keeps a count of the producers it is still waiting on
+        (pred_count). Once that count reaches 0 it is pushed onto a pending heap keyed
+        by the earliest cycle it may issue, and from there onto a ready heap keyed by
+        height once that cycle comes, so filling a bundle is a few heap pops instead
+        of a rescan of every unscheduled instruction.
+      - Of all the instructions that can issue in the current cycle, the tallest go
+        first: height is the longest chain of latencies from an instruction to the end
+        of the DAG, so the critical path is issued before work that can wait, however
+        long that work has been ready.
+      - With min_pressure=True, the instruction that grows the set of live registers the
+        least goes first instead (a register is live from the instruction that produces
+        it until its last reader issues), trading a few cycles for fewer registers held
+        at once.
+      - Intra–bundle conflicts are prevented (e.g. an instruction may not write a register
+        that is read or written by another instruction in the same bundle).
+      - slots, e.g. {"mem": 1, "alu": 2, "mul": 1}, models the functional units of the
+        machine: a bundle holds at most slots[unit] instructions of each unit (see
+        UNITS) on top of the bundle_size cap. Units missing from slots are unlimited.
+      - Schedules are memoized on (instructions, bundle_size, min_pressure, slots) in an
+        LRU cache of 64 entries, so scheduling the same DAG again only copies the
+        bundles. Instructions may also be lists; the bundles hold them as tuples.
+      - The scheduling loop itself is compiled with Numba (_schedule_kernel); this
+        wrapper only interns register names and rebuilds the bundles.
+
+    Dependency tracking is fixed: registers that are not "externally provided" are not
+    assumed to be available until they are produced in an earlier bundle. (For our DAG,
+    external registers are those that appear as LOAD keys, e.g. "input0", "input1", etc.)
+
+    Returns a list of bundles, where each bundle is a tuple: (start_cycle, list_of_instructions).
+    If a stats dict is passed, the peak number of live registers is stored in it under
+    "peak_pressure".
+    """
+    if bundle_size < 1:
+        raise ValueError("bundle_size must be >= 1")
+    # The cache key must be hashable, so instructions given as lists become tuples.
+    instructions = tuple(map(tuple, instructions))
+    slots = tuple(sorted((slots or {}).items()))
+    for unit, cap in slots:
+        if unit not in UNITS.values():
+            raise ValueError(f"Unknown functional unit: {unit}")
+        if cap < 1:
+            raise ValueError(
+                f"Functional unit {unit} needs at least one slot, got {cap}"
+            )
+    bundles, peak = _schedule_cached(instructions, bundle_size, min_pressure, slots)
+    if stats is not None:
+        stats["peak_pressure"] = peak
+    return [(cycle, list(bundle)) for cycle, bundle in bundles]
 
-    return bundles
+
+def _dependency_graph(dest_id, sources, n_regs):
+    """
+    The dependency graph that schedule_instructions schedules by, built in Python for
+    schedule_loop and dump_dag from the register columns of compile_program;
+    sources[idx] holds the source register ids of instruction idx.
+
+    Returns (preds, succs, order): preds[idx] is the set of instructions that produce a
+    register idx reads (the first writer of each register), succs[idx] the
+    instructions that read the register idx produces and order a topological order.
+    Raises ValueError if the registers form a dependency cycle, e.g. an instruction
+    that reads the register it writes.
+    """
+    n = len(dest_id)
+    producer = [-1] * n_regs
+    for idx, d in enumerate(dest_id):
+        if d >= 0 and producer[d] < 0:
+            producer[d] = idx
+    preds = [
+        {producer[s] for s in srcs if s >= 0 and producer[s] >= 0} for srcs in sources
+    ]
+    succs = [[] for _ in range(n)]
+    for idx in range(n):
+        for p in preds[idx]:
+            succs[p].append(idx)
+
+    # Topological order (the list grows while it is walked); anything left unvisited
+    # waits on itself through a cycle.
+    order = [idx for idx in range(n) if not preds[idx]]
+    waiting = [len(p) for p in preds]
+    for idx in order:
+        for succ in succs[idx]:
+            waiting[succ] -= 1
+            if waiting[succ] == 0:
+                order.append(succ)
+    if len(order) < n:
+        raise ValueError(
+            "Cannot schedule instructions: dependency cycle between registers"
+        )
+    return preds, succs, order
+
+
+def dump_dag(instructions, path):
+    """
+    Writes the dependency DAG to path as a Graphviz DOT file: one node per instruction
+    labelled with its latency, and an edge from each producer to every instruction
+    that reads its register (the same dependencies schedule_instructions uses). Inputs
+    and registers that no instruction produces are drawn as dashed external sources.
+    Like schedule_instructions, raises ValueError on a dependency cycle.
+
+    Render it with e.g. `dot -Tsvg dag.dot -o dag.svg`.
+    """
+    _, dest_id, src1_id, src2_id, _, n_regs = compile_program(instructions)
+    sources = zip(src1_id.tolist(), src2_id.tolist())
+    # Rejects the programs schedule_instructions rejects, e.g. an instruction that reads
+    # the register it writes.
+    _dependency_graph(dest_id.tolist(), sources, n_regs)
+    producer = {}
+    for idx, instr in enumerate(instructions):
+        dest, _ = get_registers(instr)
+        if dest is not None:
+            producer.setdefault(dest, idx)
+
+    lines = ["digraph dag {", "  node [shape=box];"]
+    externals = set()
+    for idx, instr in enumerate(instructions):
+        op, dest, src1, src2, size = instr
+        operands = ", ".join(str(r) for r in (dest, src1, src2) if r is not None)
+        lines.append(
+            f'  i{idx} [label="{idx}: {op} {operands}\\nlat={compute_latency(instr)}"];'
+        )
+        _, srcs = get_registers(instr)
+        for reg in dict.fromkeys(srcs):
+            p = producer.get(reg)
+            if p is None:
+                if reg not in externals:
+                    externals.add(reg)
+                    lines.append(
+                        f'  "ext:{reg}" [label="{reg}", shape=ellipse, style=dashed];'
+                    )
+                lines.append(f'  "ext:{reg}" -> i{idx} [style=dashed];')
+            else:
+                latency = compute_latency(instructions[p])
+                lines.append(f'  i{p} -> i{idx} [label="{reg}, lat={latency}"];')
+    lines.append("}")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
 
 
 # -----------------------------
@@ -134,94 +537,591 @@ def schedule_instructions(instructions, bundle_size=2):
 # -----------------------------
 
 
-def execute_instruction(instr, registers, inputs):
+class _Word32(ctypes.Union):
+    """A 32-bit machine word that can be read back as either float32 or uint32."""
+
+    _fields_ = [("f", ctypes.c_float), ("u", ctypes.c_uint32)]
+
+
+# Scratch word for FTOI/ITOF: reinterpreting the bits is one typed store and one load
+# instead of allocating bytes objects with struct.pack/unpack.
+_word = _Word32()
+
+
+def _load(registers, inputs, dest, src1, src2):
+    # For LOAD, src1 is the input key.
+    registers[dest] = inputs[src1]
+
+
+def _store(registers, inputs, dest, src1, src2):
+    # For STORE, write the value from register (stored in 'dest') to the "OUTPUT"
+    # register, which lower_program passes as src1.
+    registers[src1] = registers[dest]
+
+
+def _add(registers, inputs, dest, src1, src2):
+    registers[dest] = registers[src1] + registers[src2]
+
+
+def _sub(registers, inputs, dest, src1, src2):
+    value = registers[src1] - registers[src2]
+    if isinstance(value, int):
+        # Integer words (FTOI results, the magic number) wrap like C's uint32_t.
+        value &= 0xFFFFFFFF
+    registers[dest] = value
+
+
+def _mul(registers, inputs, dest, src1, src2):
+    registers[dest] = registers[src1] * registers[src2]
+
+
+def _move(registers, inputs, dest, src1, src2):
+    registers[dest] = registers[src1]
+
+
+def _div(registers, inputs, dest, src1, src2):
+    registers[dest] = registers[src1] / registers[src2]
+
+
+def _ftoi(registers, inputs, dest, src1, src2):
+    value = registers[src1]
+    if isinstance(value, np.ndarray):
+        # A batch of floats is reinterpreted in one go by viewing it as uint32.
+        registers[dest] = value.astype(np.float32).view(np.uint32)
+    else:
+        _word.f = value
+        registers[dest] = _word.u
+
+
+def _itof(registers, inputs, dest, src1, src2):
+    value = registers[src1]
+    if isinstance(value, np.ndarray):
+        # Widen back to float64 so the batch matches the scalar path bit for bit.
+        registers[dest] = value.astype(np.uint32).view(np.float32).astype(np.float64)
+    else:
+        _word.u = value & 0xFFFFFFFF
+        registers[dest] = _word.f
+
+
+def _shr(registers, inputs, dest, src1, src2):
+    # A logical shift of the 32-bit word, as on a uint32_t.
+    registers[dest] = (registers[src1] & 0xFFFFFFFF) >> 1
+
+
+# Dispatch table: op name -> handler(registers, inputs, dest, src1, src2).
+_OPS = {
+    "LOAD": _load,
+    "STORE": _store,
+    "ADD": _add,
+    "SUB": _sub,
+    "MUL": _mul,
+    "MOVE": _move,
+    "DIV": _div,
+    "FTOI": _ftoi,
+    "ITOF": _itof,
+    "SHR": _shr,
+}
+
+# Op-code (index in OPCODES) of every handler, for encode_program.
+_OPCODE_OF = {handler: OPCODES.index(op) for op, handler in _OPS.items()}
+
+
+def lower_program(instructions):
+    """
+    Lowers instructions to (handler, dest, src1, src2) tuples that run on an indexed
+    register file: every register name is replaced by its index, so executing an
+    instruction needs no hashing. LOAD keeps its input key, and STORE gets the index
+    of the "OUTPUT" register, which is always register 0.
+
+    Returns (code, reg_names): code[i] is instructions[i] lowered and reg_names[r]
+    is the name of register r.
+    """
+    reg_id = {"OUTPUT": 0}
+
+    def intern(reg):
+        if reg is None:
+            return None
+        return reg_id.setdefault(reg, len(reg_id))
+
+    code = []
+    for op, dest, src1, src2, size in instructions:
+        handler = _OPS.get(op)
+        if handler is None:
+            raise ValueError(f"Unknown operation: {op}")
+        if op == "LOAD":
+            code.append((handler, intern(dest), src1, None))
+        elif op == "STORE":
+            code.append((handler, intern(dest), 0, None))
+        else:
+            code.append((handler, intern(dest), intern(src1), intern(src2)))
+    return code, list(reg_id)
+
+
+def fold_constants(instructions, constants):
+    """
+    Removes every LOAD whose input key is in constants: the register it would load is
+    preset to the constant instead, so it takes no issue slot and, like any register
+    no instruction produces, is available at cycle 0. The same goes for every
+    instruction that only reads such registers (in program order): its result is
+    computed here, once, and preset too.
+
+    Returns (instructions, preset), where preset maps register name -> value.
     """
-    Execute one instruction on the simulated machine.
-    The register file (a dict) is updated.
+    kept, preset = [], {}
+    for instr in instructions:
+        op, dest, src1, src2, size = instr
+        if op == "LOAD" and src1 in constants:
+            preset[dest] = constants[src1]
+        elif (
+            op in _OPS
+            and op not in ("LOAD", "STORE")
+            and all(reg in preset for reg in get_registers(instr)[1])
+        ):
+            # Every source is a constant, so the result is one too: compute it now.
+            _OPS[op](preset, None, dest, src1, src2)
+        else:
+            kept.append(instr)
+    return kept, preset
+
+
+def execute_instruction(code, registers, inputs):
+    """
+    Execute one lowered instruction (see lower_program) on the simulated machine.
+    The register file (a list indexed by register) is updated.
 
     For:
       - LOAD: 'src1' is the key in the inputs dict.
-      - STORE: copies the register value to a special "OUTPUT" register.
+      - STORE: copies the register value to the special "OUTPUT" register.
       - Other ops: arithmetic or MOVE.
+
+    The op was resolved to its _OPS handler when the program was lowered, so running
+    it is a single call.
     """
-    op, dest, src1, src2, size = instr
-    if op == "LOAD":
-        # For LOAD, src1 is the input key.
-        registers[dest] = inputs[src1]
-    elif op == "STORE":
-        # For STORE, write the value from register (stored in 'dest') to "OUTPUT".
-        registers["OUTPUT"] = registers[dest]
-    elif op == "ADD":
-        registers[dest] = registers[src1] + registers[src2]
-    elif op == "SUB":
-        registers[dest] = registers[src1] - registers[src2]
-    elif op == "MUL":
-        registers[dest] = registers[src1] * registers[src2]
-    elif op == "MOVE":
-        registers[dest] = registers[src1]
-    elif op == "DIV":
-        registers[dest] = registers[src1] / registers[src2]
-    elif op == "FTOI":
-        registers[dest] = struct.unpack("i", struct.pack("f", registers[src1]))[0]
-    elif op == "ITOF":
-        registers[dest] = struct.unpack("f", struct.pack("i", registers[src1]))[0]
-    elif op == "SHR":
-        registers[dest] = registers[src1] >> 1
-    else:
-        raise ValueError(f"Unknown operation: {op}")
+    handler, dest, src1, src2 = code
+    handler(registers, inputs, dest, src1, src2)
 
 
-def run_program(instructions, inputs, bundle_size=2):
+def _named_registers(registers, reg_names):
+    """
+    Returns an indexed register file as a {name: value} dict of the registers that
+    were written.
+    """
+    return {
+        name: value for name, value in zip(reg_names, registers) if value is not None
+    }
+
+
+def run_program(instructions, inputs, bundle_size=2, verbose=False, constants=None):
     """
     Runs the given computation DAG:
       1. Schedules the instructions into bundles.
       2. Executes each bundle sequentially, updating the registers.
+    LOADs of the keys in constants are folded away first (see fold_constants).
+    With verbose=True the schedule, every executed bundle and the total cycle count
+    are printed.
 
     Returns the final output (from the special "OUTPUT" register).
     """
-    registers = {}  # our register file
+    instructions, preset = fold_constants(instructions, constants or {})
     bundles = schedule_instructions(instructions, bundle_size)
+    # Latency of every instruction, computed once for both the trace and the clock.
+    latency = {
+        instr: compute_latency(instr) for _, bundle in bundles for instr in bundle
+    }
 
-    # print("Scheduled Bundles:")
-    # for cycle, bundle in bundles:
-    #     print(f" Cycle {cycle}:")
-    #     for instr in bundle:
-    #         print("   ", instr, "latency", compute_latency(instr))
+    if verbose:
+        print("Scheduled Bundles:")
+        for cycle, bundle in bundles:
+            print(f" Cycle {cycle}:")
+            for instr in bundle:
+                print("   ", instr, "latency", latency[instr])
 
+    code, reg_names = lower_program(
+        [instr for _, bundle in bundles for instr in bundle]
+    )
+    registers = [preset.get(name) for name in reg_names]  # our register file
+    pc = 0
     current_cycle = 0
     for cycle, bundle in bundles:
         # Simulate waiting until the bundle's start cycle.
         if current_cycle < cycle:
             current_cycle = cycle
-        # print(f"\nExecuting bundle at cycle {current_cycle}:")
+        if verbose:
+            print(f"\nExecuting bundle at cycle {current_cycle}:")
         for instr in bundle:
-            # print(" Executing:", instr)
-            execute_instruction(instr, registers, inputs)
+            if verbose:
+                print(" Executing:", instr)
+            execute_instruction(code[pc], registers, inputs)
+            pc += 1
         # Advance time by the bundle's maximum latency.
-        bundle_latency = max(compute_latency(i) for i in bundle)
+        bundle_latency = max(latency[i] for i in bundle)
         current_cycle += bundle_latency
 
-    print("Total cycles:", current_cycle)
-    return registers
+    if verbose:
+        print("Total cycles:", current_cycle)
+    return _named_registers(registers, reg_names)
 
 
-def run_bundle(bundles, inputs):
+def run_bundle(bundles, inputs, verbose=False):
     """
-    Alternative runner that assumes the bundles have been computed.
+    Alternative runner that assumes the bundles have been computed. With verbose=True
+    every executed bundle and the total cycle count are printed.
     """
-    registers = {}  # our register file
+    latency = {
+        instr: compute_latency(instr) for _, bundle in bundles for instr in bundle
+    }
+    code, reg_names = lower_program(
+        [instr for _, bundle in bundles for instr in bundle]
+    )
+    registers = [None] * len(reg_names)  # our register file, indexed by register
+    pc = 0
     current_cycle = 0
     for cycle, bundle in bundles:
         if current_cycle < cycle:
             current_cycle = cycle
-        # print(f"\nExecuting bundle at cycle {current_cycle}:")
+        if verbose:
+            print(f"\nExecuting bundle at cycle {current_cycle}:")
         for instr in bundle:
-            # print(" Executing:", instr)
-            execute_instruction(instr, registers, inputs)
-        bundle_latency = max(compute_latency(i) for i in bundle)
+            if verbose:
+                print(" Executing:", instr)
+            execute_instruction(code[pc], registers, inputs)
+            pc += 1
+        bundle_latency = max(latency[i] for i in bundle)
         current_cycle += bundle_latency
 
-    return registers.get("OUTPUT", None)
+    if verbose:
+        print("Total cycles:", current_cycle)
+    return registers[0]
+
+
+# A program scheduled once for a fixed bundle size: the bundles to execute, the number
+# of cycles they take, the instructions lowered in execution order (see
+# lower_program) and the register file every run starts from.
+Plan = namedtuple(
+    "Plan", ["bundles", "total_cycles", "code", "reg_names", "init_registers"]
+)
+
+
+def plan_program(instructions, bundle_size=2, constants=None):
+    """
+    Schedules the instructions once and returns a Plan that run_plan can execute for
+    any number of input sets. LOADs of the keys in constants are folded into the
+    initial register file (see fold_constants).
+    """
+    instructions, preset = fold_constants(instructions, constants or {})
+    bundles = schedule_instructions(instructions, bundle_size)
+    total_cycles = 0
+    if bundles:
+        start, last_bundle = bundles[-1]
+        total_cycles = start + max(compute_latency(i) for i in last_bundle)
+    code, reg_names = lower_program(
+        [instr for _, bundle in bundles for instr in bundle]
+    )
+    init_registers = [preset.get(name) for name in reg_names]
+    return Plan(bundles, total_cycles, code, reg_names, init_registers)
+
+
+def run_plan(plan, inputs):
+    """
+    Executes an already scheduled Plan on one set of inputs. Only the instructions
+    are run: the schedule and its cycle count were fixed by plan_program.
+
+    Returns the register file.
+    """
+    registers = list(plan.init_registers)  # our register file, indexed by register
+    # plan.code is already lowered and in execution order, so this is just the calls.
+    for handler, dest, src1, src2 in plan.code:
+        handler(registers, inputs, dest, src1, src2)
+    return _named_registers(registers, plan.reg_names)
+
+
+def encode_program(code):
+    """
+    Encodes lowered code (see lower_program) for _execute_quake_kernel as an int32 array with
+    one (op, dest, src1, src2) row per instruction: op is the index of the operation in
+    OPCODES, registers keep their lowered index and a missing one is -1. The input key
+    of a LOAD is replaced by its column in input_keys.
+
+    Returns (program, input_keys).
+    """
+    input_keys = {}
+    program = np.full((len(code), 4), -1, dtype=np.int32)
+    for pc, (handler, dest, src1, src2) in enumerate(code):
+        if handler is _load:
+            src1 = input_keys.setdefault(src1, len(input_keys))
+        program[pc, 0] = _OPCODE_OF[handler]
+        program[pc, 1] = dest
+        if src1 is not None:
+            program[pc, 2] = src1
+        if src2 is not None:
+            program[pc, 3] = src2
+    return program, list(input_keys)
+
+
+# The executor functions are named apart from rms-vliw.py's _execute_rows and
+# _execute_kernel: both scripts cache their kernels compiled as __main__, and with the
+# same names and signatures the two modules' compiled symbols collide when both are
+# loaded into one process.
+@njit(cache=True)
+def _execute_quake_rows(program, registers, init_registers, inputs, start, stop):
+    """
+    Runs the encoded program (see encode_program) on input rows start..stop-1, each on
+    its own row of registers starting from a copy of init_registers.
+    """
+    # Scratch word for FTOI/ITOF, readable as float32 or uint32 like _Word32.
+    word_f = np.empty(1, dtype=np.float32)
+    word_u = word_f.view(np.uint32)
+    for row in range(start, stop):
+        regs = registers[row]
+        regs[:] = init_registers
+        for pc in range(program.shape[0]):
+            op, dest, src1, src2 = program[pc]
+            if op == 0:  # ADD
+                regs[dest] = regs[src1] + regs[src2]
+            elif op == 1:  # SUB
+                regs[dest] = regs[src1] - regs[src2]
+            elif op == 2:  # MUL
+                regs[dest] = regs[src1] * regs[src2]
+            elif op == 3:  # DIV
+                regs[dest] = regs[src1] / regs[src2]
+            elif op == 4:  # MOVE
+                regs[dest] = regs[src1]
+            elif op == 5:  # LOAD
+                regs[dest] = inputs[row, src1]
+            elif op == 6:  # STORE
+                regs[src1] = regs[dest]
+            elif op == 7:  # FTOI
+                word_f[0] = regs[src1]
+                regs[dest] = word_u[0]
+            elif op == 8:  # ITOF
+                word_u[0] = np.int64(regs[src1]) & 0xFFFFFFFF
+                regs[dest] = word_f[0]
+            else:  # SHR
+                regs[dest] = (np.int64(regs[src1]) & 0xFFFFFFFF) >> 1
+
+
+@njit(cache=True, parallel=True)
+def _execute_quake_kernel(program, init_registers, inputs, n_threads):
+    """
+    Compiled executor: runs the encoded program (see encode_program) once for every
+    row of inputs, whose columns are the program's input_keys. Each row starts from a
+    copy of init_registers. Rows are independent, so the batch is split into one
+    contiguous chunk of rows for each of n_threads threads and the chunks run in
+    parallel (static chunking keeps prange's scheduling out of the per-row work).
+
+    The register file is float64, which holds every 32-bit integer word exactly; words
+    are wrapped to 32 bits where their bits are used (SHR and ITOF).
+
+    Returns the float64 register files, one row per input row.
+    """
+    n_rows = inputs.shape[0]
+    registers = np.empty((n_rows, init_registers.shape[0]))
+    n_chunks = min(n_threads, n_rows)
+    for chunk in prange(n_chunks):
+        start, stop = chunk * n_rows // n_chunks, (chunk + 1) * n_rows // n_chunks
+        _execute_quake_rows(program, registers, init_registers, inputs, start, stop)
+    return registers
+
+
+def run_program_batch(instructions, inputs_batch, bundle_size=2, constants=None):
+    """
+    Runs the DAG on every input dict in inputs_batch, scheduling it only once.
+    The plan's code is encoded (see encode_program) and the whole batch runs in the
+    compiled _execute_quake_kernel, so every value comes back as a float.
+
+    Returns a list with one result per input dict (see run_plan).
+    """
+    plan = plan_program(instructions, bundle_size, constants)
+    program, input_keys = encode_program(plan.code)
+    inputs = np.array(
+        [[inputs[key] for key in input_keys] for inputs in inputs_batch],
+        dtype=np.float64,
+    ).reshape(len(inputs_batch), len(input_keys))
+    init_registers = np.array(
+        [np.nan if value is None else value for value in plan.init_registers],
+        dtype=np.float64,
+    )
+    # Registers that are preset or written; the rest were never set, as in run_plan.
+    defined = [value is not None for value in plan.init_registers]
+    for handler, dest, src1, src2 in plan.code:
+        defined[src1 if handler is _store else dest] = True
+    names = [name for name, is_set in zip(plan.reg_names, defined) if is_set]
+    columns = [r for r, is_set in enumerate(defined) if is_set]
+    registers = _execute_quake_kernel(
+        program, init_registers, inputs, get_num_threads()
+    )
+    registers = registers[:, columns]
+    return [dict(zip(names, row)) for row in registers.tolist()]
+
+
+LoopPlan = namedtuple("LoopPlan", ["ii", "stages", "prologue", "kernel", "epilogue"])
+
+
+def schedule_loop(instructions, bundle_size=2, ii=None):
+    """
+    Software-pipelines the DAG as the body of a loop (one iteration per input set) with
+    iterative modulo scheduling, so that later iterations start while earlier ones are
+    still running.
+      - Every instruction gets a slot t; instructions in the same slot share a bundle.
+        The kernel has ii bundles: bundle t % ii holds the instruction from stage
+        t // ii, i.e. from the iteration that started t // ii kernel passes ago.
+      - ii starts at max(ResMII, RecMII). ResMII = ceil(len(instructions) / bundle_size)
+        is the number of bundles needed to issue one iteration; RecMII is 0 because an
+        iteration never reads another iteration's registers (every iteration in flight
+        gets its own register file).
+      - Instructions are placed in topological order, tallest first, in the earliest
+        slot after their producers whose kernel bundle has a free issue slot and no
+        intra–bundle conflict. If one cannot be placed, ii grows by one and the
+        placement starts over.
+
+    Returns a LoopPlan. The kernel is one pass of ii bundles, each a list of
+    (stage, instruction) pairs; prologue and epilogue are the stages - 1 passes that
+    fill and drain the pipeline, holding only the stages that are in flight. The
+    kernel pass runs once per iteration after the first stages - 1.
+    """
+    if bundle_size < 1:
+        raise ValueError("bundle_size must be >= 1")
+    _, dest_id, src1_id, src2_id, latency, n_regs = compile_program(instructions)
+    dest_id, src1_id, src2_id = dest_id.tolist(), src1_id.tolist(), src2_id.tolist()
+    n = len(instructions)
+    if n == 0:
+        return LoopPlan(1, 1, [], [[]], [])
+
+    # preds / succs and the topological order follow the same dependency rule as
+    # schedule_instructions.
+    preds, succs, order = _dependency_graph(dest_id, zip(src1_id, src2_id), n_regs)
+    # Critical-path heights.
+    height = latency.tolist()
+    for idx in reversed(order):
+        if succs[idx]:
+            height[idx] += max(height[succ] for succ in succs[idx])
+    # Place the tallest ready instruction first, so the critical path gets the early
+    # slots.
+    placement_order = []
+    waiting = [len(p) for p in preds]
+    ready = [(-height[idx], idx) for idx in range(n) if not preds[idx]]
+    heapq.heapify(ready)
+    while ready:
+        _, idx = heapq.heappop(ready)
+        placement_order.append(idx)
+        for succ in succs[idx]:
+            waiting[succ] -= 1
+            if waiting[succ] == 0:
+                heapq.heappush(ready, (-height[succ], succ))
+
+    res_mii = -(-n // bundle_size)
+    rec_mii = 0
+    ii = max(res_mii, rec_mii, ii or 1)
+    while True:
+        slot = [0] * n
+        used = [0] * ii  # issue slots taken in each kernel bundle
+        written, read = {}, {}  # registers written / read by each slot
+        for idx in placement_order:
+            earliest = max((slot[p] + 1 for p in preds[idx]), default=0)
+            d, s1, s2 = dest_id[idx], src1_id[idx], src2_id[idx]
+            srcs = {s for s in (s1, s2) if s >= 0}
+            for t in range(earliest, earliest + ii):
+                w, r = written.setdefault(t, set()), read.setdefault(t, set())
+                # Only instructions in the same slot belong to the same iteration, so
+                # they are the only ones that can conflict on a register.
+                if (
+                    used[t % ii] >= bundle_size
+                    or (d >= 0 and (d in w or d in r))
+                    or srcs & w
+                ):
+                    continue
+                slot[idx] = t
+                used[t % ii] += 1
+                if d >= 0:
+                    w.add(d)
+                r |= srcs
+                break
+            else:
+                break
+        else:
+            break
+        ii += 1
+
+    stages = max(slot) // ii + 1
+    kernel = [[] for _ in range(ii)]
+    for idx in range(n):
+        kernel[slot[idx] % ii].append((slot[idx] // ii, instructions[idx]))
+    # Pass j of the prologue only has stages 0..j in flight; pass j of the epilogue
+    # only has stages j + 1 and up left to finish.
+    prologue = [
+        [[(s, instr) for s, instr in bundle if s <= j] for bundle in kernel]
+        for j in range(stages - 1)
+    ]
+    epilogue = [
+        [[(s, instr) for s, instr in bundle if s > j] for bundle in kernel]
+        for j in range(stages - 1)
+    ]
+    return LoopPlan(ii, stages, prologue, kernel, epilogue)
+
+
+def _check_iterations(loop, n_iterations):
+    # Every kernel pass after the prologue starts one more iteration, so a LoopPlan
+    # needs at least stages - 1 iterations to fill the pipeline, and at least one.
+    minimum = max(1, loop.stages - 1)
+    if n_iterations < minimum:
+        raise ValueError(
+            f"Loop needs at least {minimum} iterations, got {n_iterations}"
+        )
+
+
+def loop_cycles(loop, n_iterations):
+    """
+    Total cycles of running n_iterations through a LoopPlan: every non-empty bundle
+    lasts as long as its slowest instruction.
+    """
+
+    def cycles(bundles):
+        return sum(max(compute_latency(instr) for _, instr in b) for b in bundles if b)
+
+    _check_iterations(loop, n_iterations)
+    kernel_passes = n_iterations - loop.stages + 1
+    return (
+        sum(cycles(p) for p in loop.prologue)
+        + kernel_passes * cycles(loop.kernel)
+        + sum(cycles(p) for p in loop.epilogue)
+    )
+
+
+def run_loop(loop, inputs_batch):
+    """
+    Executes a LoopPlan with one iteration per input dict in inputs_batch (at least
+    one, and at least loop.stages - 1 of them). Every iteration has its own register
+    file, so the iterations in flight never clash.
+
+    Returns a list with the register file of every iteration.
+    """
+    n_iterations = len(inputs_batch)
+    _check_iterations(loop, n_iterations)
+    # Lower the kernel once; the prologue and epilogue only hold kernel instructions.
+    # Each pass is flattened to (stage, lowered instruction) pairs in bundle order.
+    kernel = [instr for bundle in loop.kernel for _, instr in bundle]
+    code, reg_names = lower_program(kernel)
+    lowered = dict(zip(kernel, code))
+
+    def lower_pass(kernel_pass):
+        return [
+            (stage, lowered[instr]) for bundle in kernel_pass for stage, instr in bundle
+        ]
+
+    kernel_passes = n_iterations - loop.stages + 1
+    passes = (
+        [lower_pass(p) for p in loop.prologue]
+        + [lower_pass(loop.kernel)] * kernel_passes
+        + [lower_pass(p) for p in loop.epilogue]
+    )
+    registers = [[None] * len(reg_names) for _ in range(n_iterations)]
+    # Pass p starts iteration p at stage 0, so an instruction of stage s in it belongs
+    # to iteration p - s.
+    for p, kernel_pass in enumerate(passes):
+        for stage, (handler, dest, src1, src2) in kernel_pass:
+            k = p - stage
+            handler(registers[k], inputs_batch[k], dest, src1, src2)
+    return [_named_registers(r, reg_names) for r in registers]
 
 
 # -----------------------------
@@ -292,6 +1192,10 @@ if __name__ == "__main__":
         "gamma1": 0.2,
         "gamma2": 0.3,
         "epsilon": 1e-6,
+    }
+
+    # Compile-time constants: their LOADs are folded away and the registers preset.
+    constants = {
         "const0": 3.0,
         "const1": 0.5,
         "const2": 1.5,
@@ -299,7 +1203,9 @@ if __name__ == "__main__":
     }
 
     print("Bundle size = 2")
-    registers = run_program(program, inputs, bundle_size=2)
+    registers = run_program(
+        program, inputs, bundle_size=2, verbose=True, constants=constants
+    )
 
     ## Intermediate results
     # print("mean_sq", registers.get("R17", None))
@@ -317,10 +1223,88 @@ if __name__ == "__main__":
     print("-" * 40)
 
     print("Bundle size = 50")
-    result = run_program(program, inputs, bundle_size=50)
+    result = run_program(
+        program, inputs, bundle_size=50, verbose=True, constants=constants
+    )
     outputs = {
         0: result.get("R29", None),
         1: result.get("R31", None),
         2: result.get("R33", None),
     }
     print("Final Outputs:", outputs)
+
+    print("-" * 40)
+
+    # Schedule once and reuse the plan for several input sets.
+    print("Batch of 3 inputs, bundle size = 50")
+    batch = [
+        dict(inputs, x0=3.0, x1=4.0, x2=5.0),
+        dict(inputs, x0=1.0, x1=2.0, x2=3.0),
+        dict(inputs, x0=-2.0, x1=0.5, x2=8.0),
+    ]
+    for registers in run_program_batch(
+        program, batch, bundle_size=50, constants=constants
+    ):
+        outputs = {
+            0: registers.get("R29", None),
+            1: registers.get("R31", None),
+            2: registers.get("R33", None),
+        }
+        print("Final Outputs:", outputs)
+
+    print("-" * 40)
+
+    # The same plan runs on whole arrays of inputs: every register then holds one value
+    # per row and each op is a single NumPy ufunc over the batch.
+    print("Batch of 1024 rows as arrays, bundle size = 50")
+    rows = np.random.default_rng(0).uniform(-5.0, 5.0, size=(1024, 3))
+    registers = run_plan(
+        plan_program(program, bundle_size=50, constants=constants),
+        dict(inputs, x0=rows[:, 0], x1=rows[:, 1], x2=rows[:, 2]),
+    )
+    outputs = np.stack([registers["R29"], registers["R31"], registers["R33"]], axis=1)
+    gamma = np.array([inputs["gamma0"], inputs["gamma1"], inputs["gamma2"]])
+    expected = rows / np.sqrt((rows**2).mean(axis=1, keepdims=True) + 1e-6) * gamma
+    print("Max relative error:", np.max(np.abs(outputs / expected - 1.0)))
+
+    print("-" * 40)
+
+    # Issuing the instructions that grow the live set the least first holds fewer
+    # registers at once. The order only matters when more instructions are ready than
+    # the bundle holds, so this runs the folded DAG one instruction per bundle: wider
+    # bundles take every ready LOAD of this DAG in either order.
+    print("Register pressure, bundle size = 1")
+    folded, _ = fold_constants(program, constants)
+    for min_pressure in (False, True):
+        stats = {}
+        bundles = schedule_instructions(
+            folded, bundle_size=1, min_pressure=min_pressure, stats=stats
+        )
+        start, last_bundle = bundles[-1]
+        total_cycles = start + max(compute_latency(i) for i in last_bundle)
+        print(
+            f"min_pressure={min_pressure}: {total_cycles} cycles,",
+            f"peak pressure {stats['peak_pressure']}",
+        )
+
+    print("-" * 40)
+
+    # Pipeline the DAG over many rows: a row starts while the previous ones are still
+    # in flight, so the cost per row drops from the schedule length to the kernel.
+    print("Software pipelined loop over 64 rows, bundle size = 4")
+    loop_rows = [
+        dict(inputs, x0=x0, x1=x1, x2=x2, **constants)
+        for x0, x1, x2 in np.random.default_rng(0).uniform(-5.0, 5.0, size=(64, 3))
+    ]
+    loop = schedule_loop(program, bundle_size=4)
+    print("II:", loop.ii, "stages:", loop.stages)
+    print("Total cycles:", loop_cycles(loop, len(loop_rows)))
+    print(
+        "Unpipelined cycles:",
+        len(loop_rows) * plan_program(program, bundle_size=4).total_cycles,
+    )
+    print(
+        "Matches run_program_batch:",
+        run_loop(loop, loop_rows)
+        == run_program_batch(program, loop_rows, bundle_size=4),
+    )
@@ -0,0 +1,33 @@
+"""
+Loads the rms-norm scripts for the tests. Their file names are not valid module names,
+so each one is loaded from its path, once, under a fixed module name.
+"""
+import atexit
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+
+# The scripts cache their Numba kernels next to their source, and a kernel cached while
+# a script was loaded under a test module name fails to load when the script runs as
+# __main__ later. The tests compile into a cache directory of their own instead, which
+# has to be set before numba is first imported.
+_cache_dir = tempfile.mkdtemp(prefix="vliw-tests-numba-")
+os.environ["NUMBA_CACHE_DIR"] = _cache_dir
+atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+
+RMS_NORM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "rms-norm")
+
+
+def load(filename):
+    """Returns the module of rms-norm/<filename>, e.g. load("rms-vliw.py")."""
+    name = os.path.splitext(filename)[0].replace("-", "_")
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            name, os.path.join(RMS_NORM, filename)
+        )
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return sys.modules[name]
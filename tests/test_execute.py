@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import execute
+
+# output = (input0 + input1) * input2, as in the execute.py example.
+PROGRAM = [
+    ("LOAD", "R1", "input0", None, 16),
+    ("LOAD", "R2", "input1", None, 16),
+    ("ADD", "R3", "R1", "R2", 1),
+    ("LOAD", "R4", "input2", None, 16),
+    ("MUL", "R5", "R3", "R4", 1),
+    ("STORE", "R5", None, None, 1),
+]
+INPUTS = {"input0": 3, "input1": 5, "input2": 10}
+
+
+class ListProgramTest(unittest.TestCase):
+    """A program written as a list of lists runs like the same program of tuples."""
+
+    def test_schedule_instructions(self):
+        as_lists = [list(instr) for instr in PROGRAM]
+        self.assertEqual(
+            execute.schedule_instructions(as_lists, bundle_size=2),
+            execute.schedule_instructions(PROGRAM, bundle_size=2),
+        )
+
+    def test_run_program(self):
+        as_lists = [list(instr) for instr in PROGRAM]
+        self.assertEqual(execute.run_program(as_lists, INPUTS, bundle_size=2), 80)
+        self.assertEqual(
+            execute.run_program(
+                as_lists, INPUTS, bundle_size=2, constants={"input2": 10}
+            ),
+            80,
+        )
+        self.assertEqual(execute.run_program_batch(as_lists, [INPUTS] * 2), [80, 80])
+
+
+class MinPressureTest(unittest.TestCase):
+    """min_pressure=True lowers the peak number of live registers."""
+
+    def test_peak_pressure(self):
+        # A sum of four loads: height-first issues every LOAD before the first ADD.
+        program = [
+            ("LOAD", "R1", "input0", None, 16),
+            ("LOAD", "R2", "input1", None, 16),
+            ("LOAD", "R3", "input2", None, 16),
+            ("LOAD", "R4", "input3", None, 16),
+            ("ADD", "R5", "R1", "R2", 1),
+            ("ADD", "R6", "R5", "R3", 1),
+            ("ADD", "R7", "R6", "R4", 1),
+            ("STORE", "R7", None, None, 1),
+        ]
+        peaks = []
+        for min_pressure in (False, True):
+            stats = {}
+            execute.schedule_instructions(
+                program, bundle_size=1, min_pressure=min_pressure, stats=stats
+            )
+            peaks.append(stats["peak_pressure"])
+        self.assertLess(peaks[1], peaks[0])
+
+
+class DumpDagTest(unittest.TestCase):
+    """dump_dag rejects the programs schedule_instructions rejects."""
+
+    def test_self_dependency(self):
+        program = PROGRAM[:2] + [("ADD", "R3", "R3", "R2", 1)] + PROGRAM[3:]
+        with self.assertRaises(ValueError):
+            execute.schedule_instructions(program, bundle_size=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "dag.dot")
+            with self.assertRaises(ValueError):
+                execute.dump_dag(program, path)
+            execute.dump_dag(PROGRAM, path)
+            with open(path) as f:
+                self.assertIn('i2 -> i4 [label="R3, lat=1"];', f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+
+from scripts import load
+
+quake = load("rms-vliw-quake-sqrt.py")
+
+
+def run_op(op, **registers):
+    """Runs one handler of the quake _OPS table on registers src1/src2 into dest."""
+    op_registers = dict(registers)
+    quake._OPS[op](op_registers, None, "dest", "src1", "src2")
+    return op_registers["dest"]
+
+
+class WordBitsTest(unittest.TestCase):
+    """FTOI/ITOF reinterpret the bits of a float32 as a uint32 word and back."""
+
+    # Negative floats have the sign bit set, so their words are >= 0x80000000.
+    WORDS = {-0.0: 0x80000000, -1.0: 0xBF800000, -2.0: 0xC0000000, 1.0: 0x3F800000}
+
+    def test_scalar_round_trip(self):
+        for value, word in self.WORDS.items():
+            self.assertEqual(run_op("FTOI", src1=value), word)
+            back = run_op("ITOF", src1=word)
+            self.assertEqual(back, value)
+            self.assertEqual(np.signbit(back), np.signbit(value))
+
+    def test_array_round_trip(self):
+        values = np.array(list(self.WORDS), dtype=np.float64)
+        words = run_op("FTOI", src1=values)
+        self.assertEqual(words.dtype, np.uint32)
+        self.assertEqual(words.tolist(), list(self.WORDS.values()))
+        back = run_op("ITOF", src1=words)
+        self.assertEqual(back.tolist(), values.tolist())
+        self.assertEqual(np.signbit(back).tolist(), np.signbit(values).tolist())
+
+    def test_program_round_trip(self):
+        # The Python executor and the compiled batch kernel agree on every word.
+        program = [
+            ("LOAD", "R1", "x", None, 16),
+            ("FTOI", "R2", "R1", None, 1),
+            ("ITOF", "R3", "R2", None, 1),
+            ("STORE", "R3", None, None, 1),
+        ]
+        batch = [{"x": value} for value in self.WORDS]
+        rows = quake.run_program_batch(program, batch)
+        for inputs, row in zip(batch, rows):
+            registers = quake.run_program(program, inputs)
+            self.assertEqual(registers["R2"], self.WORDS[inputs["x"]])
+            self.assertEqual(row["R2"], self.WORDS[inputs["x"]])
+            self.assertEqual(registers["OUTPUT"], inputs["x"])
+            self.assertEqual(row["OUTPUT"], inputs["x"])
+
+
+class Uint32Test(unittest.TestCase):
+    """SUB and SHR treat integer words like C's uint32_t."""
+
+    def test_sub_wraps(self):
+        self.assertEqual(run_op("SUB", src1=1, src2=2), 0xFFFFFFFF)
+        self.assertEqual(run_op("SUB", src1=0, src2=0x80000000), 0x80000000)
+        self.assertEqual(run_op("SUB", src1=0x5F3759DF, src2=0x1FC00000), 0x3F7759DF)
+        # Floats are not words and keep their sign.
+        self.assertEqual(run_op("SUB", src1=1.0, src2=2.0), -1.0)
+
+    def test_shr_is_logical(self):
+        # An arithmetic shift would copy the sign bit down: 0xC0000000, 0xE0000000.
+        self.assertEqual(run_op("SHR", src1=0x80000000), 0x40000000)
+        self.assertEqual(run_op("SHR", src1=0xC0000001), 0x60000000)
+        self.assertEqual(run_op("SHR", src1=-2), 0x7FFFFFFF)
+
+    def test_program_wraps(self):
+        # The compiled kernel keeps words in float64 registers and only masks them to
+        # 32 bits where they are read as words (SHR, ITOF), so a wrapped SUB must give
+        # the same word on both executors once it is shifted.
+        program = [
+            ("LOAD", "R1", "a", None, 16),
+            ("LOAD", "R2", "b", None, 16),
+            ("SUB", "R3", "R1", "R2", 1),
+            ("SHR", "R4", "R3", None, 1),
+            ("STORE", "R4", None, None, 1),
+        ]
+        batch = [{"a": 1, "b": 2}, {"a": 0, "b": 0x80000000}, {"a": 5, "b": 3}]
+        expected = [0x7FFFFFFF, 0x40000000, 1]
+        rows = quake.run_program_batch(program, batch)
+        for inputs, row, word in zip(batch, rows, expected):
+            self.assertEqual(quake.run_program(program, inputs)["OUTPUT"], word)
+            self.assertEqual(row["OUTPUT"], word)
+
+
+class SlotsTest(unittest.TestCase):
+    """slots caps the instructions of each functional unit in a bundle."""
+
+    @staticmethod
+    def run_bundles(bundles, inputs):
+        """{name: value} of every register after running the bundles in order."""
+        code, reg_names = quake.lower_program([i for _, b in bundles for i in b])
+        registers = [None] * len(reg_names)
+        for instr in code:
+            quake.execute_instruction(instr, registers, inputs)
+        return quake._named_registers(registers, reg_names)
+
+    # The Quake seed of 1 / sqrt(x) for four independent inputs.
+    PROGRAM = [("LOAD", "MAGIC", "magic", None, 16)] + [
+        instr
+        for lane in range(4)
+        for instr in (
+            ("LOAD", f"X{lane}", f"x{lane}", None, 16),
+            ("FTOI", f"I{lane}", f"X{lane}", None, 1),
+            ("SHR", f"H{lane}", f"I{lane}", None, 1),
+            ("SUB", f"S{lane}", "MAGIC", f"H{lane}", 1),
+            ("ITOF", f"Y{lane}", f"S{lane}", None, 1),
+            ("STORE", f"Y{lane}", f"y{lane}", None, 1),
+        )
+    ]
+
+    def test_caps_respected(self):
+        for slots in ({"alu": 1}, {"alu": 2, "mem": 1}, {"mem": 1}):
+            for bundle_size in (2, 4, 8):
+                bundles = quake.schedule_instructions(
+                    self.PROGRAM, bundle_size, slots=slots
+                )
+                scheduled = [instr for _, bundle in bundles for instr in bundle]
+                self.assertCountEqual(scheduled, self.PROGRAM)
+                for _, bundle in bundles:
+                    self.assertLessEqual(len(bundle), bundle_size)
+                    for unit, cap in slots.items():
+                        used = sum(quake.UNITS[instr[0]] == unit for instr in bundle)
+                        self.assertLessEqual(used, cap)
+
+    def test_same_outputs(self):
+        inputs = {f"x{lane}": 4.0**lane for lane in range(4)}
+        inputs["magic"] = 0x5F3759DF
+        want = self.run_bundles(quake.schedule_instructions(self.PROGRAM, 8), inputs)
+        bundles = quake.schedule_instructions(self.PROGRAM, 8, slots={"alu": 1})
+        got = self.run_bundles(bundles, inputs)
+        self.assertEqual(got, want)
+        self.assertEqual(len(got), 4 * 5 + 2)
+
+    def test_invalid_slots(self):
+        with self.assertRaises(ValueError):
+            quake.schedule_instructions(self.PROGRAM, 2, slots={"fpu": 1})
+        with self.assertRaises(ValueError):
+            quake.schedule_instructions(self.PROGRAM, 2, slots={"alu": 0})
+
+
+class BatchTest(unittest.TestCase):
+    """run_program_batch runs the rows in the compiled kernel, split over threads."""
+
+    def test_matches_run_program(self):
+        program = SlotsTest.PROGRAM
+        outputs = [f"Y{lane}" for lane in range(4)]
+        rng = np.random.default_rng(0)
+        for n_rows in (0, 1, 3, 97):
+            batch = [
+                dict({f"x{lane}": x for lane, x in enumerate(row)}, magic=0x5F3759DF)
+                for row in rng.uniform(1e-3, 1e3, size=(n_rows, 4)).tolist()
+            ]
+            rows = quake.run_program_batch(program, batch, 4)
+            self.assertEqual(len(rows), n_rows)
+            for inputs, row in zip(batch, rows):
+                registers = quake.run_program(program, inputs, 4)
+                for reg in outputs:
+                    self.assertEqual(row[reg], registers[reg])
+
+    def test_beside_rms_vliw(self):
+        # Both scripts compile a batch kernel; they must load and run in one process.
+        vliw = load("rms-vliw.py")
+        program = [
+            ("LOAD", "R1", "x", None, 16),
+            ("LOAD", "R2", "y", None, 16),
+            ("SUB", "R3", "R1", "R2", 1),
+            ("STORE", "R3", "out", None, 1),
+        ]
+        batch = [{"x": 5.0, "y": 3.0}, {"x": 1.0, "y": 4.0}]
+        expected = [2.0, -3.0]
+        for module in (quake, vliw, quake):
+            rows = module.run_program_batch(program, batch)
+            self.assertEqual([row["OUTPUT"] for row in rows], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numpy as np
+
+from scripts import load
+
+basic = load("rms-basic.py")
+
+
+class RsqrtFixedTest(unittest.TestCase):
+    """rsqrt_fixed range-reduces n, so it is accurate over the whole float64 range."""
+
+    def test_magnitudes(self):
+        tiny = np.finfo(np.float64).tiny
+        big = np.finfo(np.float64).max
+        # Denormals down to the smallest one, the normal range edges and huge values.
+        edges = [5e-324, 1e-320, 1e-310, tiny / 2, tiny, 1e300, big / 2, big]
+        sweep = np.logspace(-323, 308, 4001)
+        mantissas = np.random.default_rng(0).uniform(0.5, 2.0, 1000)
+        eps = np.finfo(np.float64).eps
+        for n in np.concatenate([edges, sweep, mantissas]):
+            expected = 1.0 / np.sqrt(n)
+            error = abs(basic.rsqrt_fixed(n) - expected)
+            self.assertLessEqual(error, 2 * eps * expected, f"rsqrt_fixed({n!r})")
+
+    def test_special_values(self):
+        self.assertEqual(basic.rsqrt_fixed(0.0), np.inf)
+        self.assertEqual(basic.rsqrt_fixed(np.inf), 0.0)
+        self.assertTrue(np.isnan(basic.rsqrt_fixed(-1.0)))
+        self.assertTrue(np.isnan(basic.rsqrt_fixed(np.nan)))
+
+
+class RmsLayerNormTest(unittest.TestCase):
+    def test_matches_numpy(self):
+        x = np.array([3.0, 4.0, 5.0])
+        gamma = np.array([0.1, 0.2, 0.3])
+        expected = x / np.sqrt(np.mean(x * x) + 1e-8) * gamma
+        np.testing.assert_allclose(basic.rms_layer_norm(x, gamma), expected, rtol=1e-15)
+
+    def test_invalid_input(self):
+        with self.assertRaises(ValueError):
+            basic.rms_layer_norm([], [])
+        with self.assertRaises(ValueError):
+            basic.rms_layer_norm([[1.0, 2.0]], [[1.0, 2.0]])
+        with self.assertRaises(ValueError):
+            basic.rms_layer_norm(3.0, 1.0)
+        with self.assertRaises(ValueError):
+            basic.rms_layer_norm([1.0, 2.0], [1.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
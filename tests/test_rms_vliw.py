@@ -0,0 +1,525 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import numba
+import numpy as np
+
+from scripts import load
+
+vliw = load("rms-vliw.py")
+
+# RMS normalization of three values with three Newton steps for the square root, the
+# same DAG as the rms-vliw.py demo with fewer steps.
+PROGRAM = [
+    ("LOAD", "R1", "x0", None, 16),
+    ("LOAD", "R2", "x1", None, 16),
+    ("LOAD", "R3", "x2", None, 16),
+    ("LOAD", "R4", "gamma0", None, 16),
+    ("LOAD", "R5", "gamma1", None, 16),
+    ("LOAD", "R6", "gamma2", None, 16),
+    ("LOAD", "R7", "epsilon", None, 16),
+    ("LOAD", "R8", "const0", None, 16),
+    ("LOAD", "R9", "const1", None, 16),
+    ("MUL", "R10", "R1", "R1", 1),
+    ("MUL", "R11", "R2", "R2", 1),
+    ("MUL", "R12", "R3", "R3", 1),
+    ("ADD", "R13", "R10", "R11", 1),
+    ("ADD", "R14", "R13", "R12", 1),
+    ("DIV", "R15", "R14", "R8", 1),
+    ("ADD", "R16", "R15", "R7", 1),
+    ("MOVE", "R17", "R16", None, 0),
+    ("DIV", "R18", "R16", "R17", 1),
+    ("ADD", "R19", "R17", "R18", 1),
+    ("MUL", "R20", "R9", "R19", 1),
+    ("DIV", "R21", "R16", "R20", 1),
+    ("ADD", "R22", "R20", "R21", 1),
+    ("MUL", "R23", "R9", "R22", 1),
+    ("DIV", "R24", "R16", "R23", 1),
+    ("ADD", "R25", "R23", "R24", 1),
+    ("MUL", "R26", "R9", "R25", 1),
+    ("MOVE", "R27", "R26", None, 0),
+    ("DIV", "R28", "R1", "R27", 1),
+    ("MUL", "R29", "R28", "R4", 1),
+    ("DIV", "R30", "R2", "R27", 1),
+    ("MUL", "R31", "R30", "R5", 1),
+    ("DIV", "R32", "R3", "R27", 1),
+    ("MUL", "R33", "R32", "R6", 1),
+    ("STORE", "R29", "norm0", None, 1),
+    ("STORE", "R31", "norm1", None, 1),
+    ("STORE", "R33", "norm2", None, 1),
+]
+OUTPUTS = ("R29", "R31", "R33")
+CONSTANTS = {"const0": 3.0, "const1": 0.5}
+
+
+def make_batch(n_rows, seed=0):
+    """n_rows input dicts for PROGRAM with random x and gamma, constants included."""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "x0": x0, "x1": x1, "x2": x2,
+            "gamma0": g0, "gamma1": g1, "gamma2": g2,
+            "epsilon": 1e-6, **CONSTANTS,
+        }
+        for x0, x1, x2, g0, g1, g2 in rng.uniform(-5.0, 5.0, size=(n_rows, 6)).tolist()
+    ]
+
+
+class FoldConstantsTest(unittest.TestCase):
+    """fold_constants presets the registers LOADs of constants would fill."""
+
+    def test_loads_folded(self):
+        kept, preset = vliw.fold_constants(PROGRAM, CONSTANTS)
+        self.assertEqual(preset, {"R8": 3.0, "R9": 0.5})
+        self.assertEqual(len(kept), len(PROGRAM) - 2)
+        self.assertNotIn(("LOAD", "R8", "const0", None, 16), kept)
+
+    def test_constant_instructions_folded(self):
+        program = [
+            ("LOAD", "R1", "x", None, 16),
+            ("LOAD", "R2", "two", None, 16),
+            ("LOAD", "R3", "three", None, 16),
+            ("MUL", "R4", "R2", "R3", 1),
+            ("ADD", "R5", "R4", "R2", 1),
+            ("MUL", "R6", "R1", "R5", 1),
+            ("STORE", "R6", "out", None, 1),
+        ]
+        kept, preset = vliw.fold_constants(program, {"two": 2.0, "three": 3.0})
+        self.assertEqual(preset, {"R2": 2.0, "R3": 3.0, "R4": 6.0, "R5": 8.0})
+        self.assertEqual([instr[0] for instr in kept], ["LOAD", "MUL", "STORE"])
+
+    def test_same_outputs_fewer_cycles(self):
+        batch = make_batch(8)
+        variables = [
+            {key: value for key, value in inputs.items() if key not in CONSTANTS}
+            for inputs in batch
+        ]
+        for bundle_size in (1, 2, 4):
+            plain = vliw.plan_program(PROGRAM, bundle_size)
+            folded = vliw.plan_program(PROGRAM, bundle_size, CONSTANTS)
+            self.assertEqual(len(folded.code), len(plain.code) - 2)
+            self.assertLessEqual(folded.total_cycles, plain.total_cycles)
+            for inputs, variable in zip(batch, variables):
+                want = vliw.run_plan(plain, inputs)
+                got = vliw.run_plan(folded, variable)
+                run = vliw.run_program(
+                    PROGRAM, variable, bundle_size, constants=CONSTANTS
+                )
+                for reg in OUTPUTS:
+                    self.assertEqual(got[reg], want[reg])
+                    self.assertEqual(run[reg], want[reg])
+        # With one slot per bundle the two LOADs cost two bundles of their own.
+        self.assertLess(
+            vliw.plan_program(PROGRAM, 1, CONSTANTS).total_cycles,
+            vliw.plan_program(PROGRAM, 1).total_cycles,
+        )
+
+
+# PROGRAM with x and gamma held in one vector register each.
+VECTOR_PROGRAM = [
+    ("LOAD", "V1", "x", None, 16),
+    ("LOAD", "V4", "gamma", None, 16),
+    ("LOAD", "R7", "epsilon", None, 16),
+    ("LOAD", "R8", "const0", None, 16),
+    ("LOAD", "R9", "const1", None, 16),
+    ("MUL", "V10", "V1", "V1", 1),
+    ("VSUM", "R14", "V10", None, 1),
+    *PROGRAM[14:27],  # mean, epsilon and Newton, unchanged
+    ("DIV", "V28", "V1", "R27", 1),
+    ("MUL", "V29", "V28", "V4", 1),
+    ("STORE", "V29", "norm", None, 1),
+]
+
+
+def vector_inputs(inputs):
+    """The inputs of VECTOR_PROGRAM for the PROGRAM inputs in inputs."""
+    return {
+        "x": np.array([inputs["x0"], inputs["x1"], inputs["x2"]]),
+        "gamma": np.array([inputs["gamma0"], inputs["gamma1"], inputs["gamma2"]]),
+        "epsilon": inputs["epsilon"],
+    }
+
+
+class VsumTest(unittest.TestCase):
+    """VSUM adds up the lanes of a vector register, so the DAG can run lane-wise."""
+
+    def test_vector_matches_scalar(self):
+        for inputs in make_batch(8):
+            scalar = vliw.run_program(PROGRAM, inputs, constants=CONSTANTS)
+            vector = vliw.run_program(
+                VECTOR_PROGRAM, vector_inputs(inputs), constants=CONSTANTS
+            )
+            np.testing.assert_allclose(
+                vector["V29"], [scalar[reg] for reg in OUTPUTS], rtol=1e-15
+            )
+            np.testing.assert_array_equal(vector["OUTPUT"], vector["V29"])
+
+    def test_fewer_cycles(self):
+        for bundle_size in (1, 2, 4):
+            scalar = vliw.plan_program(PROGRAM, bundle_size, CONSTANTS)
+            vector = vliw.plan_program(VECTOR_PROGRAM, bundle_size, CONSTANTS)
+            self.assertLess(vector.total_cycles, scalar.total_cycles)
+
+    def test_keeps_lane_dtype(self):
+        for dtype in (np.float32, np.float64):
+            registers = {"v": np.array([1.0, 2.0, 3.5], dtype=dtype)}
+            vliw._vsum(registers, None, "sum", "v", None)
+            self.assertEqual(registers["sum"].dtype, dtype)
+            self.assertEqual(registers["sum"], 6.5)
+
+    def test_batch_rejects_vsum(self):
+        batch = [vector_inputs(inputs) for inputs in make_batch(2)]
+        with self.assertRaises(ValueError):
+            vliw.run_program_batch(VECTOR_PROGRAM, batch, constants=CONSTANTS)
+
+
+# PROGRAM with the Newton square root replaced by an RSQRT estimate of 1 / rms and one
+# Newton step y = 0.5 * y * (3 - n * y * y).
+RSQRT_PROGRAM = [
+    *PROGRAM[:16],  # loads, mean and epsilon, unchanged
+    ("RSQRT", "R17", "R16", None, 1),
+    ("MUL", "R18", "R16", "R17", 1),
+    ("MUL", "R19", "R18", "R17", 1),
+    ("SUB", "R20", "R8", "R19", 1),
+    ("MUL", "R21", "R9", "R17", 1),
+    ("MUL", "R22", "R21", "R20", 1),
+    ("MUL", "R28", "R1", "R22", 1),
+    ("MUL", "R29", "R28", "R4", 1),
+    ("MUL", "R30", "R2", "R22", 1),
+    ("MUL", "R31", "R30", "R5", 1),
+    ("MUL", "R32", "R3", "R22", 1),
+    ("MUL", "R33", "R32", "R6", 1),
+    *PROGRAM[-3:],  # stores, unchanged
+]
+
+
+class RsqrtTest(unittest.TestCase):
+    """RSQRT is a float32-accurate estimate of 1 / sqrt(x) that the DAG refines."""
+
+    def test_estimate(self):
+        values = np.array([1e-30, 0.5, 1.0, 3.0, 1e4, 1e30])
+        for value in values:
+            registers = {"x": value}
+            vliw._rsqrt(registers, None, "y", "x", None)
+            self.assertAlmostEqual(registers["y"] * np.sqrt(value), 1.0, delta=2**-22)
+
+    def test_dtype_and_lanes(self):
+        for value, dtype in (
+            (np.float64(4.0), np.float64),
+            (np.float32(4.0), np.float32),
+            (np.float16(4.0), np.float16),
+            (4, np.float64),
+        ):
+            registers = {"x": value}
+            vliw._rsqrt(registers, None, "y", "x", None)
+            self.assertEqual(np.asarray(registers["y"]).shape, ())
+            self.assertEqual(registers["y"].dtype, dtype)
+            self.assertEqual(registers["y"], 0.5)
+        for dtype in (np.float32, np.float64):
+            registers = {"v": np.array([1.0, 4.0, 16.0], dtype=dtype)}
+            vliw._rsqrt(registers, None, "w", "v", None)
+            self.assertEqual(registers["w"].dtype, dtype)
+            self.assertEqual(registers["w"].tolist(), [1.0, 0.5, 0.25])
+
+    def test_program_close_to_exact(self):
+        batch = make_batch(16)
+        rows = vliw.run_program_batch(RSQRT_PROGRAM, batch, constants=CONSTANTS)
+        for inputs, row in zip(batch, rows):
+            x = np.array([inputs["x0"], inputs["x1"], inputs["x2"]])
+            gamma = np.array([inputs["gamma0"], inputs["gamma1"], inputs["gamma2"]])
+            exact = x / np.sqrt(np.mean(x * x) + inputs["epsilon"]) * gamma
+            registers = vliw.run_program(RSQRT_PROGRAM, inputs, constants=CONSTANTS)
+            outputs = [registers[reg] for reg in OUTPUTS]
+            # One Newton step squares the float32 estimate's relative error.
+            np.testing.assert_allclose(outputs, exact, rtol=1e-12)
+            self.assertEqual([row[reg] for reg in OUTPUTS], outputs)
+
+    def test_fewer_cycles(self):
+        for bundle_size in (1, 2, 4):
+            newton = vliw.plan_program(PROGRAM, bundle_size, CONSTANTS)
+            rsqrt = vliw.plan_program(RSQRT_PROGRAM, bundle_size, CONSTANTS)
+            self.assertLess(rsqrt.total_cycles, newton.total_cycles)
+
+
+# PROGRAM with the sum of squares accumulated by FMAs: R13 = x1 * x1 + R10 and
+# R14 = x2 * x2 + R13 replace the MULs of x1 and x2 and both ADDs.
+FMA_PROGRAM = [
+    *PROGRAM[:10],
+    ("FMA", "R13", "R2", "R2", 1, "R10"),
+    ("FMA", "R14", "R3", "R3", 1, "R13"),
+    *PROGRAM[14:],
+]
+
+
+class FmaTest(unittest.TestCase):
+    """FMA d = src1 * src2 + src3 takes its addend as a sixth field."""
+
+    def test_handler(self):
+        registers = {"a": 3.0, "b": 4.0, "c": 0.5}
+        vliw._fma(registers, None, "d", "a", ("b", "c"))
+        self.assertEqual(registers["d"], 12.5)
+
+    def test_matches_mul_add(self):
+        batch = make_batch(16)
+        rows = vliw.run_program_batch(FMA_PROGRAM, batch, constants=CONSTANTS)
+        for inputs, row in zip(batch, rows):
+            want = vliw.run_program(PROGRAM, inputs, constants=CONSTANTS)
+            got = vliw.run_program(FMA_PROGRAM, inputs, constants=CONSTANTS)
+            for reg in ("R14", *OUTPUTS):
+                self.assertEqual(got[reg], want[reg])
+                self.assertEqual(row[reg], want[reg])
+        loop = vliw.schedule_loop(FMA_PROGRAM, 4)
+        for row, want in zip(vliw.run_loop(loop, batch), rows):
+            for reg in OUTPUTS:
+                self.assertEqual(row[reg], want[reg])
+
+    def test_waits_for_addend(self):
+        latency = {instr: vliw.compute_latency(instr) for instr in FMA_PROGRAM}
+        for bundle_size in (1, 2, 4, 8):
+            for min_pressure in (False, True):
+                done = {}
+                for cycle, bundle in vliw.schedule_instructions(
+                    FMA_PROGRAM, bundle_size, min_pressure
+                ):
+                    for instr in bundle:
+                        if instr[0] == "FMA":
+                            self.assertGreaterEqual(cycle, done[instr[5]])
+                        done[instr[1]] = cycle + latency[instr]
+
+    def test_missing_addend(self):
+        with self.assertRaises(ValueError):
+            vliw.schedule_instructions([("FMA", "R3", "R1", "R2", 1)])
+
+    def test_passes(self):
+        program = [
+            ("LOAD", "R1", "x", None, 16),
+            ("LOAD", "R2", "two", None, 16),
+            ("LOAD", "R3", "three", None, 16),
+            ("FMA", "R4", "R2", "R3", 1, "R2"),
+            ("MOVE", "R5", "R1", None, 0),
+            ("FMA", "R6", "R4", "R4", 1, "R5"),
+            ("STORE", "R6", "out", None, 1),
+        ]
+        constants = {"two": 2.0, "three": 3.0}
+        kept, preset = vliw.fold_constants(program, constants)
+        self.assertEqual(preset["R4"], 8.0)
+        kept, aliases = vliw.propagate_copies(kept)
+        self.assertEqual(aliases, {"R5": "R1"})
+        self.assertIn(("FMA", "R6", "R4", "R4", 1, "R1"), kept)
+        registers = vliw.run_program(program, {"x": 1.5}, constants=constants)
+        self.assertEqual(registers["OUTPUT"], 65.5)
+
+
+class DtypeTest(unittest.TestCase):
+    """dtype runs the whole register file at a reduced precision."""
+
+    def test_run_program(self):
+        batch = make_batch(8)
+        for dtype, rtol in ((np.float32, 1e-6), (np.float16, 1e-2)):
+            for inputs in batch:
+                want = vliw.run_program(PROGRAM, inputs, constants=CONSTANTS)
+                got = vliw.run_program(PROGRAM, inputs, constants=CONSTANTS, dtype=dtype)
+                for reg in OUTPUTS:
+                    self.assertIsInstance(got[reg], dtype)
+                    self.assertAlmostEqual(got[reg] / want[reg], 1.0, delta=rtol)
+
+    def test_run_program_batch(self):
+        batch = make_batch(8)
+        want = vliw.run_program_batch(PROGRAM, batch, constants=CONSTANTS)
+        got = vliw.run_program_batch(PROGRAM, batch, constants=CONSTANTS, dtype=np.float32)
+        for inputs, want_row, got_row in zip(batch, want, got):
+            single = vliw.run_program(
+                PROGRAM, inputs, constants=CONSTANTS, dtype=np.float32
+            )
+            for reg in OUTPUTS:
+                # The batch comes back as floats, but every value is a float32.
+                self.assertEqual(np.float32(got_row[reg]), got_row[reg])
+                self.assertEqual(got_row[reg], single[reg])
+                self.assertNotEqual(got_row[reg], want_row[reg])
+                self.assertAlmostEqual(got_row[reg] / want_row[reg], 1.0, delta=1e-6)
+
+    def test_vector_lanes(self):
+        inputs = make_batch(1)[0]
+        registers = vliw.run_program(
+            VECTOR_PROGRAM, vector_inputs(inputs), constants=CONSTANTS, dtype=np.float32
+        )
+        self.assertEqual(registers["V29"].dtype, np.float32)
+        self.assertIsInstance(registers["R14"], np.float32)
+
+
+class SlotsTest(unittest.TestCase):
+    """slots caps the instructions of each functional unit in a bundle."""
+
+    @staticmethod
+    def run_bundles(bundles, inputs):
+        """{name: value} of every register after running the bundles in order."""
+        code, reg_names = vliw.lower_program([i for _, b in bundles for i in b])
+        registers = [None] * len(reg_names)
+        for instr in code:
+            vliw.execute_instruction(instr, registers, inputs)
+        return vliw._named_registers(registers, reg_names)
+
+    def check_schedule(self, bundles, program, bundle_size, slots):
+        latency = {instr: vliw.compute_latency(instr) for instr in program}
+        done = {}
+        for cycle, bundle in bundles:
+            self.assertLessEqual(len(bundle), bundle_size)
+            for unit, cap in slots.items():
+                used = sum(vliw.UNITS[instr[0]] == unit for instr in bundle)
+                self.assertLessEqual(used, cap)
+            for instr in bundle:
+                for reg in vliw.get_registers(instr)[1]:
+                    self.assertGreaterEqual(cycle, done.get(reg, 0))
+            for instr in bundle:
+                if instr[0] != "STORE":
+                    done[instr[1]] = cycle + latency[instr]
+        scheduled = [instr for _, bundle in bundles for instr in bundle]
+        self.assertCountEqual(scheduled, program)
+
+    def test_caps_respected(self):
+        program, _ = vliw.fold_constants(FMA_PROGRAM, CONSTANTS)
+        for slots in (
+            {"mem": 1},
+            {"mem": 1, "alu": 1, "mul": 1},
+            {"mul": 2, "alu": 3},
+            {"mem": 2, "mul": 1},
+        ):
+            for bundle_size in (2, 4, 8):
+                for min_pressure in (False, True):
+                    bundles = vliw.schedule_instructions(
+                        program, bundle_size, min_pressure, slots=slots
+                    )
+                    self.check_schedule(bundles, program, bundle_size, slots)
+
+    def test_same_outputs(self):
+        inputs = make_batch(1)[0]
+        want = self.run_bundles(vliw.schedule_instructions(PROGRAM, 4), inputs)
+        bundles = vliw.schedule_instructions(PROGRAM, 4, slots={"mem": 1, "mul": 1})
+        self.assertEqual(self.run_bundles(bundles, inputs), want)
+
+    def test_single_mem_slot(self):
+        # Nine LOADs through a single mem slot take at least nine bundles.
+        bundles = vliw.schedule_instructions(PROGRAM[:9], 8, slots={"mem": 1})
+        self.assertEqual([len(bundle) for _, bundle in bundles], [1] * 9)
+
+    def test_invalid_slots(self):
+        with self.assertRaises(ValueError):
+            vliw.schedule_instructions(PROGRAM, 2, slots={"fpu": 1})
+        with self.assertRaises(ValueError):
+            vliw.schedule_instructions(PROGRAM, 2, slots={"mem": 0})
+
+
+class PropagateCopiesTest(unittest.TestCase):
+    """propagate_copies drops MOVEs and points their readers at the copied register."""
+
+    def test_moves_removed(self):
+        kept, aliases = vliw.propagate_copies(PROGRAM)
+        self.assertEqual(aliases, {"R17": "R16", "R27": "R26"})
+        self.assertEqual(len(kept), len(PROGRAM) - 2)
+        self.assertNotIn("MOVE", [instr[0] for instr in kept])
+        for instr in kept:
+            self.assertFalse(set(vliw.get_registers(instr)[1]) & set(aliases))
+
+    def test_same_outputs_fewer_cycles(self):
+        kept, _ = vliw.propagate_copies(PROGRAM)
+        batch = make_batch(8)
+        want = vliw.run_program_batch(PROGRAM, batch, constants=CONSTANTS)
+        got = vliw.run_program_batch(kept, batch, constants=CONSTANTS)
+        for inputs, want_row, got_row in zip(batch, want, got):
+            registers = vliw.run_program(kept, inputs, constants=CONSTANTS)
+            for reg in OUTPUTS:
+                self.assertEqual(got_row[reg], want_row[reg])
+                self.assertEqual(registers[reg], want_row[reg])
+        for bundle_size in (1, 2, 4):
+            self.assertLess(
+                vliw.plan_program(kept, bundle_size, CONSTANTS).total_cycles,
+                vliw.plan_program(PROGRAM, bundle_size, CONSTANTS).total_cycles,
+            )
+
+    def test_chained_moves(self):
+        program = [
+            ("LOAD", "R1", "x", None, 16),
+            ("MOVE", "R2", "R1", None, 0),
+            ("MOVE", "R3", "R2", None, 0),
+            ("ADD", "R4", "R3", "R2", 1),
+            ("STORE", "R3", "out", None, 1),
+        ]
+        kept, aliases = vliw.propagate_copies(program)
+        self.assertEqual(aliases, {"R2": "R1", "R3": "R1"})
+        self.assertEqual(
+            kept,
+            [
+                ("LOAD", "R1", "x", None, 16),
+                ("ADD", "R4", "R1", "R1", 1),
+                ("STORE", "R1", "out", None, 1),
+            ],
+        )
+
+
+class BatchTest(unittest.TestCase):
+    """run_program_batch splits the rows over threads; every row runs on its own."""
+
+    def test_matches_run_program(self):
+        # Fewer rows than threads, one row and no rows exercise the chunking too.
+        for n_rows in (0, 1, 3, 97):
+            batch = make_batch(n_rows, seed=n_rows)
+            rows = vliw.run_program_batch(PROGRAM, batch, 4, constants=CONSTANTS)
+            self.assertEqual(len(rows), n_rows)
+            for inputs, row in zip(batch, rows):
+                registers = vliw.run_program(PROGRAM, inputs, 4, constants=CONSTANTS)
+                self.assertEqual(row, registers)
+
+    def test_thread_count(self):
+        batch = make_batch(50)
+        want = vliw.run_program_batch(PROGRAM, batch, constants=CONSTANTS)
+        threads = numba.get_num_threads()
+        try:
+            numba.set_num_threads(1)
+            got = vliw.run_program_batch(PROGRAM, batch, constants=CONSTANTS)
+        finally:
+            numba.set_num_threads(threads)
+        self.assertEqual(got, want)
+
+
+class LoopTest(unittest.TestCase):
+    """schedule_loop / run_loop / loop_cycles software-pipeline the DAG over rows."""
+
+    def test_run_loop_matches_batch(self):
+        batch = make_batch(40)
+        for bundle_size in (1, 2, 4, 8):
+            loop = vliw.schedule_loop(PROGRAM, bundle_size)
+            rows = vliw.run_loop(loop, batch)
+            expected = vliw.run_program_batch(PROGRAM, batch, bundle_size)
+            self.assertEqual(len(rows), len(batch))
+            for row, want in zip(rows, expected):
+                for reg in OUTPUTS:
+                    self.assertEqual(row[reg], want[reg])
+                self.assertEqual(row["OUTPUT"], want["OUTPUT"])
+
+    def test_loop_beats_unpipelined(self):
+        n_iterations = 64
+        for bundle_size in (2, 4, 8):
+            loop = vliw.schedule_loop(PROGRAM, bundle_size)
+            total = vliw.plan_program(PROGRAM, bundle_size).total_cycles
+            self.assertLess(vliw.loop_cycles(loop, n_iterations), n_iterations * total)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            vliw.schedule_loop(PROGRAM, 0)
+        loop = vliw.schedule_loop(PROGRAM, 4)
+        self.assertGreater(loop.stages, 2)
+        with self.assertRaises(ValueError):
+            vliw.loop_cycles(loop, 0)
+        with self.assertRaises(ValueError):
+            vliw.loop_cycles(loop, loop.stages - 2)
+        with self.assertRaises(ValueError):
+            vliw.run_loop(loop, [])
+        with self.assertRaises(ValueError):
+            vliw.run_loop(loop, make_batch(loop.stages - 2))
+
+
+if __name__ == "__main__":
+    unittest.main()